@@ -1,10 +1,92 @@
-import os, inspect, sys
+import os, inspect, sys, time
+from collections import namedtuple, deque
 from datetime import datetime
 import FreeCAD, FreeCADGui
 
+# Structured event kept in the in-memory ring buffer of FCADLogger. 'Values'
+# is a tuple of any extra information, usually numbers.
+LogEvent = namedtuple('FCADLogEvent', ('Time','Tag','Level','Event',
+    'Assembly','Constraint','Values'))
+
 class FCADLogger:
+    # Generation counter of FreeCAD log level changes. Each logger caches its
+    # log level, and only queries FreeCAD again if the generation changes, or
+    # the cached level expires.
+    _generation = 0
+
+    # Expiry time in seconds of the cached log level, to pick up changes that
+    # are not notified through the log level parameter group
+    _levelExpiry = 1.0
+
+    # Bounded ring buffer of structured events shared by all loggers. Events
+    # are recorded regardless of the log level, and are meant to be cheap
+    # enough to be always on. The buffer is only formatted when dumped.
+    _events = deque(maxlen=2000)
+
+    @classmethod
+    def setEventCapacity(cls,capacity):
+        cls._events = deque(cls._events,maxlen=capacity)
+
+    @classmethod
+    def getEvents(cls):
+        return list(cls._events)
+
+    @classmethod
+    def clearEvents(cls):
+        cls._events.clear()
+
+    @classmethod
+    def dumpEvents(cls,path=None,clear=True,maxSize=0):
+        '''
+        Dump the recorded events to the given file path, or to the console if
+        no path is given. Return the number of dumped events.
+
+        maxSize: if non zero, and the file is larger than this size in bytes,
+        rotate it to 'path.1' before dumping, replacing any existing one.
+        '''
+        events = cls.getEvents()
+        if clear:
+            cls.clearEvents()
+        names = ('error','warn','info','debug','trace')
+        lines = []
+        for e in events:
+            lines.append('{} <{}> {} {}{}{}{}\n'.format(
+                datetime.fromtimestamp(e.Time).strftime('%H:%M:%S.%f'),
+                e.Tag, names[e.Level], e.Event,
+                ' ' + e.Assembly if e.Assembly else '',
+                ' ' + e.Constraint if e.Constraint else '',
+                ' ' + ' '.join([str(v) for v in e.Values]) \
+                        if e.Values else ''))
+        if path:
+            if maxSize and os.path.isfile(path) and \
+               os.path.getsize(path) > maxSize:
+                backup = path + '.1'
+                if os.path.exists(backup):
+                    os.remove(backup)
+                os.rename(path,backup)
+            with open(path,'a') as f:
+                f.write('--- {} events dumped at {}\n'.format(
+                    len(events),datetime.now()))
+                f.writelines(lines)
+        else:
+            for line in lines:
+                FreeCAD.Console.PrintMessage(line)
+        return len(events)
+
+    @classmethod
+    def refreshLevel(cls):
+        '''
+        Invalidate the cached log levels of all loggers. This is called on
+        any change of the log level parameter group, i.e. BaseApp/LogLevels.
+        Call it for immediate effect if the log level is changed otherwise.
+        '''
+        cls._generation += 1
+
     def __init__(self, tag, **kargs):
         self.tag = tag
+        self._level = 0
+        self._levelGeneration = -1
+        self._levelStamp = 0
         self.levels = { 'error':0, 'warn':1, 'info':2,
                 'debug':3, 'trace':4 }
         self.printer = [
@@ -18,35 +100,74 @@ class FCADLogger:
                 ('timing',True),('lineno',True),('parent',None)):
             setattr(self,key,kargs.get(key,default))
 
+    def getLevel(self):
+        now = time.time()
+        if self._levelGeneration != FCADLogger._generation or \
+           now - self._levelStamp > FCADLogger._levelExpiry:
+            self._level = FreeCAD.getLogLevel(self.tag)
+            self._levelGeneration = FCADLogger._generation
+            self._levelStamp = now
+        return self._level
+
     def _isEnabledFor(self,level):
         if self.parent and not self.parent._isEnabledFor(level):
             return False
-        return FreeCAD.getLogLevel(self.tag) >= level
+        return self.getLevel() >= level
 
     def isEnabledFor(self,level):
         if not isinstance(level,int):
             level = self.levels[level]
         return self._isEnabledFor(level)
 
-    def error(self,msg,frame=0):
-        self.log(0,msg,frame+1)
-
-    def warn(self,msg,frame=0):
-        self.log(1,msg,frame+1)
-
-    def info(self,msg,frame=0):
-        self.log(2,msg,frame+1)
-
-    def debug(self,msg,frame=0):
-        self.log(3,msg,frame+1)
-
-    def trace(self,msg,frame=0):
-        self.log(4,msg,frame+1)
+    # The logging functions below accept deferred message formatting, which
+    # only happens if the message is actually going to be printed. The
+    # message can either be a callable that returns the message, or a format
+    # string with positional arguments, e.g.
+    #
+    #   logger.debug('{}: {}', key, handle)
+    #   logger.debug(lambda: 'cache {}'.format(cache.dump()))
+    #
+    # Use the keyword argument 'frame' to adjust the reported caller frame.
+
+    def error(self,msg,*args,**kargs):
+        self.log(0,msg,kargs.get('frame',0)+1,args)
+
+    def warn(self,msg,*args,**kargs):
+        self.log(1,msg,kargs.get('frame',0)+1,args)
+
+    def info(self,msg,*args,**kargs):
+        self.log(2,msg,kargs.get('frame',0)+1,args)
+
+    def debug(self,msg,*args,**kargs):
+        self.log(3,msg,kargs.get('frame',0)+1,args)
+
+    def trace(self,msg,*args,**kargs):
+        self.log(4,msg,kargs.get('frame',0)+1,args)
+
+    def record(self,level,event,assembly='',constraint='',*values):
+        '''
+        Record a structured event into the ring buffer
+
+        level: log level name or number
+        event: short event name
+        assembly: name of the assembly involved
+        constraint: name of the constraint involved
+        values: any extra information, usually numbers
+        '''
+        if not isinstance(level,int):
+            level = self.levels[level]
+        self._events.append(LogEvent(time.time(),self.tag,level,event,
+            assembly,constraint,values))
 
-    def log(self,level,msg,frame=0):
+    def log(self,level,msg,frame=0,args=None):
         if not self._isEnabledFor(level):
             return
 
+        if callable(msg):
+            msg = msg()
+        elif args:
+            msg = msg.format(*args)
+
         prefix = ''
 
         if self.printTag:
@@ -111,3 +232,14 @@ class FCADLogger:
             import PySide
             PySide.QtGui.QMessageBox.critical(
                     FreeCADGui.getMainWindow(),'Assembly',e.message)
+
+
+class _LevelObserver(object):
+    'Observer of the log level parameter group'
+    def onChange(self,_grp,_name):
+        FCADLogger.refreshLevel()
+
+# FreeCAD.setLogLevel() and the parameter editor both change the parameter
+# group, so observe it to invalidate the cached logger levels
+_levelObserver = _LevelObserver()
+FreeCAD.ParamGet('User parameter:BaseApp/LogLevels').Attach(_levelObserver)
@@ -1,8 +1,8 @@
-import os
+import os, time, zlib
 from collections import namedtuple
 import FreeCAD, FreeCADGui, Part
 from PySide import QtCore, QtGui
-from . import utils, gui
+from . import utils, gui, parallel
 from .utils import logger, objName
 from .constraint import Constraint, cstrName
 from .system import System
@@ -709,7 +709,7 @@ def getElementInfo(parent, subname, checkPlacement=False):
                     # that when the elements are collapsed, there is really
                     # no element object here.
                     part = (part[0],int(idx),part[1])
-                    pla = part[0].PlacementList[idx]
+                    pla = part[0].PlacementList[part[1]]
                 except ValueError:
                     raise RuntimeError('invalid array subname of element {}: '
                         '{}'.format(objName(parent),subnameRef))
@@ -744,6 +744,49 @@ def getElementInfo(parent, subname, checkPlacement=False):
                     Shape = shape.copy())
 
 
+def getArrayElementCount(info):
+    '''Return the element count of the link array containing the element, or
+    0 if the element does not come from a link array
+
+    Parameters:
+
+        info: ElementInfo of an element inside some link array element, e.g.
+        as obtained from AsmElementLink.getInfo()
+    '''
+    if not isTypeOf(info.Parent,AsmPartGroup):
+        return 0
+    names = info.SubnameRef.split('.')
+    if len(names)<3:
+        return 0
+    part = info.Parent.getSubObject(names[0]+'.',1)
+    if not part or isTypeOf(part,Assembly,True):
+        return 0
+    getter = getattr(part.getLinkedObject(True),'getLinkExtProperty',None)
+    return getter('ElementCount') if getter else 0
+
+def getArrayElementInfo(info):
+    '''Return a list of element information of all link array elements
+
+    Parameters:
+
+        info: ElementInfo of an element inside some link array element, e.g.
+        as obtained from AsmElementLink.getInfo()
+
+    Return a list of ElementInfo of the same element inside every element of
+    the link array, ordered by array index, or None if the element does not
+    come from a link array.
+    '''
+    count = getArrayElementCount(info)
+    if not count:
+        return
+    names = info.SubnameRef.split('.')
+    ret = []
+    for i in range(count):
+        names[1] = str(i)
+        ret.append(getElementInfo(info.Parent,'.'.join(names)))
+    return ret
+
+
 class AsmElementLink(AsmBase):
     def __init__(self,parent):
         super(AsmElementLink,self).__init__()
@@ -957,7 +1000,8 @@ class AsmConstraint(AsmGroup):
             return
         assembly = getattr(parent,'Object',None)
         if not assembly or \
-           System.isConstraintSupported(assembly,Constraint.getTypeName(obj)):
+           System.isConstraintSupported(assembly,
+                   Constraint.getSolverTypeName(obj)):
             return
         raise RuntimeError('Constraint type "{}" is not supported by '
                 'solver "{}"'.format(Constraint.getTypeName(obj),
@@ -997,7 +1041,12 @@ class AsmConstraint(AsmGroup):
             return
         ret = getattr(self,'elements',None)
         if ret or Constraint.isDisabled(obj):
+            if refresh:
+                self.updatePartMap(None)
             return ret
+        # Drop the old part references first, in case of early exit below, so
+        # that the part changes no longer trigger solving of this constraint
+        self.updatePartMap(None)
         elementInfo = []
         elements = []
         for o in obj.Group:
@@ -1009,8 +1058,19 @@ class AsmConstraint(AsmGroup):
             elements.append(o)
         Constraint.check(obj,elementInfo,True)
         self.elements = elements
+        self.updatePartMap(elementInfo)
         return self.elements
 
+    def updatePartMap(self,elementInfo):
+        # this function maybe called during document restore, when the parent
+        # assembly is not fully setup yet. Assembly.execute() will catch up
+        # later.
+        parent = getattr(self,'parent',None)
+        assembly = getattr(parent,'parent',None)
+        if not assembly or getattr(assembly,'cstrParts',None) is None:
+            return
+        assembly.updateConstraintParts(self.Object,elementInfo)
+
     def getElementsInfo(self):
         return [ e.Proxy.getInfo() for e in self.getElements() ]
 
@@ -1025,6 +1085,31 @@ class AsmConstraint(AsmGroup):
         The selected elements must all belong to the same immediate parent
         assembly. 
         '''
+        if sels:
+            ret = AsmConstraint.parseSelection(sels)
+        else:
+            # the parsing is independent of the constraint type, and shared
+            # by all the constraint commands when checking activation
+            ret = gui.SelectionObserver.getCached('AsmConstraint',
+                    AsmConstraint.parseSelection)
+        cstr,elementInfo = ret[0].Constraint,ret[1]
+        if not Constraint.isDisabled(cstr):
+            if cstr:
+                typeid = Constraint.getTypeID(cstr)
+                check = []
+                for o in cstr.Group:
+                    check.append(o.Proxy.getInfo())
+                elementInfo = check + elementInfo
+
+            Constraint.check(typeid,elementInfo)
+        return ret[0]
+
+    @staticmethod
+    def parseSelection(sels=None):
+        '''
+        Parse Gui.Selection for the constraint, without checking the
+        constraint type. Return a tuple(AsmConstraint.Selection,elementInfo)
+        '''
         if not sels:
             sels = FreeCADGui.Selection.getSelectionEx('',False)
         if not sels:
@@ -1102,21 +1187,11 @@ class AsmConstraint(AsmGroup):
             elementInfo.append(getElementInfo(
                 assembly,found.Object.Name+'.'+sub))
 
-        if not Constraint.isDisabled(cstr):
-            if cstr:
-                typeid = Constraint.getTypeID(cstr)
-                check = []
-                for o in cstr.Group:
-                    check.append(o.Proxy.getInfo())
-                elementInfo = check + elementInfo
-
-            Constraint.check(typeid,elementInfo)
-
-        return AsmConstraint.Selection(SelObject=sel.Object,
-                                       SelSubname=selSubname,
-                                       Assembly = assembly,
-                                       Constraint = cstr,
-                                       Elements = elements)
+        return (AsmConstraint.Selection(SelObject=sel.Object,
+                                        SelSubname=selSubname,
+                                        Assembly = assembly,
+                                        Constraint = cstr,
+                                        Elements = elements), elementInfo)
 
     @staticmethod
     def make(typeid,sel=None,name='Constraint',undo=True):
@@ -1332,15 +1407,225 @@ BuildShapeCut = 'Cut'
 BuildShapeNames = (BuildShapeNone,BuildShapeCompound,
         BuildShapeFuse,BuildShapeCut)
 
+class AsmFuseCache(object):
+    '''
+    Cache of the boolean fusion of part shapes
+
+    The solids of each part form a leaf, keyed by the hash and placement of
+    the part shape. The input shape is kept with the leaf, so that its hash,
+    which is based on the address of the underlying shape, can not be reused
+    by another shape while cached, and is checked with isSame() on lookup.
+    The leaves are placed in a binary trie by the checksum of the part
+    object name, and fused pairwise bottom up, with each tree node cached by
+    the keys of its children. The tree does not depend on the order of the
+    parts, so when one part changes, or is added or removed, only the nodes
+    on its path to the root are fused again.
+    Nodes of the same tree level are independent, and are fused in the
+    shared worker pool if the measured local fusion time is expected to
+    outweigh the measured overhead of transferring the shapes.
+    '''
+
+    # minimum number of pending fusions in a tree level to go parallel
+    _ParallelMin = 2
+    # moving average of the time in seconds of a local pairwise fusion
+    _FuseTime = None
+    # moving average of the overhead in seconds of a parallel tree level,
+    # initially accounting for spawning the worker pool
+    _ParallelOverhead = 2.0
+    _CostAlpha = 0.3
+
+    def __init__(self):
+        self.cache = {}
+        # leaf key -> tuple(input shape, fused solids)
+        self.leaves = {}
+
+    def clear(self):
+        self.cache.clear()
+        self.leaves.clear()
+
+    @staticmethod
+    def getKey(shape):
+        pla = shape.Placement
+        return (shape.hashCode(),len(shape.Solids),
+                tuple(pla.Base)+tuple(pla.Rotation.Q))
+
+    @staticmethod
+    def getOrder(name):
+        'Return the position of a part in the tree, given its object name'
+        return zlib.crc32(name.encode('utf8')) & 0xffffffff
+
+    def build(self,shapes,base=None):
+        '''
+        Return the fusion of the solids of the given part shapes, or if
+        'base' is given, the base shape cut by the fusion
+
+        shapes: list of tuple(name,shape), where 'name' is the part object
+        name, which decides the position of the shape in the tree
+
+        base: optional tuple(name,shape) of the base part
+        '''
+        # Only the nodes used in this call are kept, so that the cache does
+        # not grow
+        used = {}
+        leaves = {}
+        key,result = self._fuse(shapes,used,leaves)
+        if base is not None:
+            baseKey,baseResult = self._fuse([base],used,leaves)
+            if baseResult is None:
+                raise RuntimeError('First part has no solid')
+            if result is None:
+                result = baseResult
+            else:
+                key = ('cut',baseKey,key)
+                tool = result
+                result = self.cache.get(key,None)
+                if result is None:
+                    result = baseResult.cut(tool)
+                used[key] = result
+        if result is None:
+            raise RuntimeError('No solids found in parts')
+        self.cache = used
+        self.leaves = leaves
+        return result
+
+    def _fuse(self,shapes,used,leaves):
+        level = []
+        for name,shape in shapes:
+            solids = shape.Solids
+            if not solids:
+                continue
+            key = self.getKey(shape)
+            entry = self.leaves.get(key,None)
+            if entry is not None and not entry[0].isSame(shape):
+                # hash collision, so none of the cached nodes can be trusted
+                logger.debug('fusion cache key collision')
+                self.cache = {}
+                self.leaves = {}
+                entry = None
+            if entry is None:
+                if len(solids) == 1:
+                    result = solids[0]
+                else:
+                    result = solids[0].fuse(solids[1:])
+                entry = (shape,result)
+            leaves[key] = entry
+            used[key] = entry[1]
+            level.append((self.getOrder(name),key))
+        if not level:
+            return None,None
+
+        level.sort()
+        while len(level) > 1:
+            # Fuse the nodes sharing the longest common prefix of their
+            # positions, and carry the others over to the next level
+            shift = min([(level[i][0]^level[i+1][0]).bit_length()
+                            for i in range(len(level)-1)])
+            nodes = []
+            pending = []
+            i = 0
+            while i < len(level):
+                if i+1 == len(level) or \
+                   level[i][0]>>shift != level[i+1][0]>>shift:
+                    nodes.append(level[i])
+                    i += 1
+                    continue
+                key = (level[i][1],level[i+1][1])
+                nodes.append((level[i][0],key))
+                i += 2
+                result = self.cache.get(key,None)
+                if result is None:
+                    pending.append(key)
+                else:
+                    used[key] = result
+            results = None
+            if self.shouldFuseParallel(len(pending)):
+                results = logger.catch('parallel fusion failed',
+                        self.fuseParallel,pending,used)
+            if results is None:
+                results = self.fuseLocal(pending,used)
+            for key,result in zip(pending,results):
+                used[key] = result
+            level = nodes
+        key = level[0][1]
+        return key,used[key]
+
+    @classmethod
+    def _updateCost(cls,name,old,cost):
+        if old is not None:
+            cost = old + cls._CostAlpha*(cost-old)
+        setattr(AsmFuseCache,name,cost)
+
+    @classmethod
+    def shouldFuseParallel(cls,count):
+        if count < cls._ParallelMin or cls._FuseTime is None or \
+           not parallel.isSupported():
+            return False
+        serial = count*cls._FuseTime
+        workers = parallel.getWorkerCount(count)
+        return serial > cls._ParallelOverhead + serial/workers
+
+    @classmethod
+    def fuseLocal(cls,pending,shapes):
+        stamp = time.time()
+        ret = [shapes[k1].fuse(shapes[k2]) for k1,k2 in pending]
+        if pending:
+            cls._updateCost('_FuseTime',cls._FuseTime,
+                    (time.time()-stamp)/len(pending))
+        return ret
+
+    @classmethod
+    def fuseParallel(cls,pending,shapes):
+        stamp = time.time()
+        tasks = [(shapes[k1].exportBrepToString(),
+                  shapes[k2].exportBrepToString()) for k1,k2 in pending]
+        ret = []
+        for (k1,k2),brep in zip(pending,
+                parallel.mapAll(parallel.fuseShapes,tasks)):
+            if brep is None or isinstance(brep,Exception):
+                if isinstance(brep,Exception):
+                    logger.warn('fusion worker failed: {}',brep)
+                ret.append(shapes[k1].fuse(shapes[k2]))
+            else:
+                shape = Part.Shape()
+                shape.importBrepFromString(brep)
+                ret.append(shape)
+        # overhead = elapsed time - ideal parallel fusion time
+        workers = parallel.getWorkerCount(len(pending))
+        cls._updateCost('_ParallelOverhead',cls._ParallelOverhead,
+                max(0.0,time.time()-stamp-
+                    len(pending)*cls._FuseTime/workers))
+        return ret
+
+
+# A rigid sub-assembly is solved on its own, and moves as a single body when
+# solving the parent assembly. A flexible sub-assembly is solved together
+# with its parent, so that the parent constraints can move both the
+# sub-assembly as a whole, and its parts relative to it.
+SolveModeRigid = 'Rigid'
+SolveModeFlexible = 'Flexible'
+SolveModeNames = (SolveModeRigid,SolveModeFlexible)
+
 class Assembly(AsmGroup):
     _Timer = QtCore.QTimer()
+    _TimerStarted = None # time of the first pending auto solve request
+    _SolvePending = set() # assemblies requesting the pending auto solve
+    _SolveCost = 0.15 # moving estimate of auto solve time in seconds
+    _SolveCostAlpha = 0.3 # smoothing factor of the solve time estimation
+    _SolveDelayFactor = 2.0 # debounce delay relative to the estimated cost
+    _SolveDelayMin = 20 # minimum debounce delay in ms
+    _SolveDelayMax = 1000 # maximum debounce delay in ms
+    _SolveMaxWait = 2000 # maximum ms to defer a pending auto solve
+    _ShapeTimer = QtCore.QTimer()
+    _ShapePending = set() # assemblies waiting for deferred shape building
+    _ShapeDelay = 500 # delay in ms of deferred shape building
     _PartMap = {} # maps part to assembly
     _PartArrayMap = {} # maps array part to assembly
 
     def __init__(self):
-        self.parts = set()
-        self.partArrays = set()
         self.constraints = None
+        self.cstrParts = {} # maps constraint to the set of its parts
+        self.partCstrs = {} # reverse map from part to a set of constraints
+        self.shapeStale = True
         super(Assembly,self).__init__()
 
     def getSubObjects(self,obj):
@@ -1362,34 +1647,87 @@ class Assembly(AsmGroup):
                 return (obj,mat,None)
         return False
 
-    def _collectParts(self,oldParts,newParts,partMap):
-        for part in newParts:
-            try:
-                oldParts.remove(part)
-            except KeyError:
-                partMap[part] = self
-        for part in oldParts:
+    def _addPartRef(self,key,cstr):
+        cstrs = self.partCstrs.get(key,None)
+        if not cstrs:
+            cstrs = set()
+            self.partCstrs[key] = cstrs
+            part,isArray = key
+            if isArray:
+                Assembly._PartArrayMap[part] = self
+            else:
+                Assembly._PartMap[part] = self
+        cstrs.add(cstr)
+
+    def _removePartRef(self,key,cstr):
+        cstrs = self.partCstrs.get(key,None)
+        if not cstrs:
+            return
+        cstrs.discard(cstr)
+        if cstrs:
+            return
+        del self.partCstrs[key]
+        part,isArray = key
+        partMap = Assembly._PartArrayMap if isArray else Assembly._PartMap
+        if partMap.get(part,None) == self:
             del partMap[part]
-        return newParts
+
+    def updateConstraintParts(self,cstr,elementInfo):
+        '''
+        Update the part maps with the elements of the given constraint
+
+        cstr: the constraint object
+
+        elementInfo: list of AsmElementInfo of the constraint's elements. None
+        to remove the constraint from the map.
+        '''
+        parts = set()
+        if elementInfo:
+            for info in elementInfo:
+                if isinstance(info.Part,tuple):
+                    parts.add((info.Part[0],True))
+                else:
+                    parts.add((info.Part,False))
+        oldParts = self.cstrParts.get(cstr,set())
+        for key in oldParts - parts:
+            self._removePartRef(key,cstr)
+        for key in parts - oldParts:
+            self._addPartRef(key,cstr)
+        if parts:
+            self.cstrParts[cstr] = parts
+        else:
+            self.cstrParts.pop(cstr,None)
+
+    def getPartConstraints(self,part,isArray=False):
+        'Return the set of constraints referring to the given part'
+        return self.partCstrs.get((part,isArray),())
 
     def execute(self,obj):
         self.constraints = None
-        self.buildShape()
+        # The shape is built after the document recompute, or later when
+        # idle, unless some other feature is going to be recomputed using it
+        self.shapeStale = True
+        if self.hasShapeConsumer():
+            self.buildShape()
+        else:
+            Assembly.scheduleBuildShape(self)
         System.touch(obj)
         obj.ViewObject.Proxy.onExecute()
 
-        parts = set()
-        partArrays = set()
-        for cstr in self.getConstraints():
-            for element in cstr.Proxy.getElements():
-                info = element.Proxy.getInfo()
-                if isinstance(info.Part,tuple):
-                    partArrays.add(info.Part[0])
-                else:
-                    parts.add(info.Part)
-        parts = self._collectParts(self.parts,parts,Assembly._PartMap)
-        partArrays = self._collectParts(
-                self.partArrays,partArrays,Assembly._PartArrayMap)
+        # The part maps are maintained incrementally by the constraints when
+        # their elements are refreshed. Here we only need to purge those
+        # removed or disabled constraints, and pick up those not mapped yet,
+        # e.g. during document restore.
+        cstrs = set(self.getConstraints())
+        for cstr in list(self.cstrParts):
+            if cstr not in cstrs:
+                self.updateConstraintParts(cstr,None)
+        for cstr in cstrs:
+            if cstr not in self.cstrParts:
+                elements = cstr.Proxy.getElements()
+                if elements:
+                    self.updateConstraintParts(cstr,
+                            [ e.Proxy.getInfo() for e in elements ])
 
         return False # return False to call LinkBaseExtension::execute()
 
@@ -1404,39 +1742,90 @@ class Assembly(AsmGroup):
 
     @classmethod
     def checkPartChange(cls, obj, prop):
-        if not cls.canAutoSolve() or prop in _IgnoredProperties:
-            return
-        assembly = None
         if prop == 'Placement':
             partMap = cls._PartMap
-            assembly = partMap.get(obj,None)
+            isArray = False
         elif prop == 'PlacementList':
             partMap = cls._PartArrayMap
-            assembly = partMap.get(obj,None)
-        if assembly:
-            try:
-                # This will fail if assembly got deleted
-                assembly.Object.Name
-            except Exception:
-                del partMap[obj]
-            else:
-                cls.autoSolve(True)
+            isArray = True
+        else:
+            return
+        assembly = partMap.get(obj,None)
+        if not assembly or not cls.canAutoSolve():
+            return
+        try:
+            # This will fail if assembly got deleted
+            assembly.Object.Name
+        except Exception:
+            del partMap[obj]
+            return
+        cstrs = assembly.getPartConstraints(obj,isArray)
+        if not cstrs:
+            return
+        if logger.isEnabledFor('debug'):
+            logger.debug('{} change of {} affects {}'.format(prop,
+                objName(obj),', '.join([cstrName(c) for c in cstrs])))
+        cls.autoSolve(True,assembly)
+
+    @classmethod
+    def estimateCost(cls,old,cost):
+        if old is None:
+            return cost
+        return old + cls._SolveCostAlpha*(cost-old)
+
+    def recordSolveCost(self,cost):
+        'called by the solver to record the time (in seconds) spent solving'
+        self.solveCost = Assembly.estimateCost(
+                getattr(self,'solveCost',None),cost)
+
+    @classmethod
+    def getAutoSolveDelay(cls):
+        '''
+        Return the debounce delay in ms of the pending auto solve
+
+        The delay is proportional to the estimated cost of solving the
+        requesting assemblies, and bounded by _SolveMaxWait counting from the
+        first pending request, so that continuous editing still solves
+        eventually.
+        '''
+        if cls._SolvePending:
+            cost = 0.0
+            for assembly in cls._SolvePending:
+                est = getattr(assembly,'solveCost',None)
+                cost += cls._SolveCost if est is None else est
+        else:
+            cost = cls._SolveCost
+        delay = min(cls._SolveDelayMax,
+                    max(cls._SolveDelayMin,cost*1000*cls._SolveDelayFactor))
+        waited = (time.time()-cls._TimerStarted)*1000
+        return int(max(0,min(delay,cls._SolveMaxWait-waited)))
 
     @classmethod
-    def autoSolve(cls,force=False):
+    def autoSolve(cls,force=False,assembly=None):
         if force or cls.canAutoSolve():
             if not cls._Timer.isSingleShot():
                 cls._Timer.setSingleShot(True)
                 cls._Timer.timeout.connect(Assembly.onSolverTimer)
-            logger.debug('auto solve scheduled',frame=1)
-            cls._Timer.start(300)
+                cls._SolveMaxWait = gui.AsmCmdAutoRecompute.getParam(
+                        'Int','AutoSolveMaxWait',cls._SolveMaxWait)
+            if cls._TimerStarted is None or not cls._Timer.isActive():
+                cls._TimerStarted = time.time()
+                cls._SolvePending = set()
+            if assembly:
+                cls._SolvePending.add(assembly)
+            delay = cls.getAutoSolveDelay()
+            logger.debug('auto solve scheduled in {}ms'.format(delay),frame=1)
+            cls._Timer.start(delay)
 
     @classmethod
     def cancelAutoSolve(cls):
         cls._Timer.stop()
+        cls._TimerStarted = None
+        cls._SolvePending = set()
 
     @classmethod
     def onSolverTimer(cls):
+        cls._TimerStarted = None
         if not cls.canAutoSolve():
             return
         ret = FreeCAD.getActiveTransaction()
@@ -1446,8 +1835,10 @@ class Assembly(AsmGroup):
             return
         from . import solver
         FreeCAD.setActiveTransaction('Assembly auto recompute')
+        stamp = time.time()
         logger.catch('solver exception when auto recompute',
                 solver.solve, FreeCAD.ActiveDocument.Objects, True)
+        cls._SolveCost = cls.estimateCost(cls._SolveCost,time.time()-stamp)
         FreeCAD.closeActiveTransaction()
 
     def onSolverChanged(self,setup=False):
@@ -1460,8 +1851,112 @@ class Assembly(AsmGroup):
             if not touched:
                 obj.purgeTouched()
 
+    def hasShapeConsumer(self):
+        '''
+        Check if any non-assembly shape feature depends on this assembly,
+        either directly or through links
+        '''
+        for o in self.Object.getInListRecursive():
+            if o.isDerivedFrom('Part::Feature') and not isTypeOf(o,AsmBase):
+                return True
+        return False
+
+    @classmethod
+    def scheduleBuildShape(cls,assembly):
+        '''
+        Schedule building the stale shape of the assembly. The timer is
+        restarted on each request, so the shape is not built while the
+        assembly keeps being recomputed, e.g. when dragging parts.
+        '''
+        if not cls._ShapeTimer.isSingleShot():
+            cls._ShapeTimer.setSingleShot(True)
+            cls._ShapeTimer.timeout.connect(Assembly.onShapeTimer)
+        cls._ShapePending.add(assembly)
+        cls._ShapeTimer.start(cls._ShapeDelay)
+
+    @classmethod
+    def canBuildShape(cls):
+        '''
+        Check if it is safe to build the pending shapes now, i.e. no solving
+        or part moving is in progress, and no auto solve is pending
+        '''
+        from . import solver
+        return not solver.isBusy() and not ViewProviderAssembly.isBusy() \
+                and not cls._Timer.isActive()
+
+    @classmethod
+    def buildPendingShapes(cls,doc=None):
+        for assembly in list(cls._ShapePending):
+            try:
+                # This will fail if assembly got deleted
+                obj = assembly.Object
+                name = objName(obj)
+            except Exception:
+                cls._ShapePending.discard(assembly)
+                continue
+            if doc and obj.Document != doc:
+                continue
+            cls._ShapePending.discard(assembly)
+            logger.catch('failed to build shape of {}'.format(name),
+                    assembly.ensureShape)
+
+    @classmethod
+    def onShapeTimer(cls):
+        if not cls.canBuildShape():
+            # still solving or editing, try again later
+            cls._ShapeTimer.start(cls._ShapeDelay)
+            return
+        cls.buildPendingShapes()
+
+    @classmethod
+    def onRecomputedDocument(cls,doc):
+        # Build the stale shapes as soon as the recompute is done, so that
+        # the shape is up to date when accessed by scripts, e.g. for
+        # exporting. It is left to the timer if the assembly is going to be
+        # recomputed again soon.
+        if cls._ShapePending and cls.canBuildShape():
+            cls.buildPendingShapes(doc)
+
+    def ensureShape(self):
+        '''
+        Build the shape if it is marked stale. The shape is not built during
+        solving or part moving, in which case the stale shape is kept.
+        '''
+        if not getattr(self,'shapeStale',False):
+            return
+        from . import solver
+        if solver.isBusy() or ViewProviderAssembly.isBusy():
+            return
+        self.buildShape()
+
+    @staticmethod
+    def buildShapes(objs=None):
+        '''
+        Build the shapes of the given assemblies, or the selected assemblies,
+        or all assemblies of the active document
+        '''
+        if objs is None:
+            objs = Assembly.getSelection()
+            if not objs and FreeCAD.ActiveDocument:
+                objs = FreeCAD.ActiveDocument.Objects
+        for obj in objs:
+            obj = obj.getLinkedObject(True)
+            if isTypeOf(obj,Assembly):
+                obj.Proxy.buildShape()
+
+    @staticmethod
+    def onSaveDocument(doc):
+        # Compound shape is persisted, so bring it up to date before saving
+        for obj in doc.Objects:
+            if isTypeOf(obj,Assembly) and \
+               obj.BuildShape == BuildShapeCompound:
+                logger.catch('failed to build shape of {}'.format(
+                    objName(obj)),obj.Proxy.ensureShape)
+
     def buildShape(self):
         obj = self.Object
+        # clear the flag first, so that a failed build is not retried
+        self.shapeStale = False
         if obj.BuildShape == BuildShapeNone:
             if not obj.Shape.isNull():
                 obj.Shape = Part.Shape()
@@ -1472,14 +1967,26 @@ class Assembly(AsmGroup):
         group = partGroup.Group
         if not group:
             raise RuntimeError('no parts')
-        if obj.BuildShape == BuildShapeCut:
-            shape = Part.getShape(group[0]).Solids
-            if not shape:
-                raise RuntimeError('First part has no solid')
-            if len(shape)>1:
-                shape = [shape[0].fuse(shape[1:])]
-            group = group[1:]
 
+        # sub-assembly shapes may still be waiting for deferred building
+        for o in group:
+            sobj = o.getLinkedObject(True)
+            if isTypeOf(sobj,Assembly):
+                sobj.Proxy.ensureShape()
+
+        if obj.BuildShape in (BuildShapeFuse,BuildShapeCut):
+            cache = getattr(self,'fuseCache',None)
+            if not cache:
+                cache = self.fuseCache = AsmFuseCache()
+            base = None
+            if obj.BuildShape == BuildShapeCut:
+                base = (group[0].Name,Part.getShape(group[0]))
+                group = group[1:]
+            obj.Shape = cache.build([(o.Name,Part.getShape(o)) for o in group
+                            if obj.isElementVisible(o.Name)], base)
+            return
+
+        self.fuseCache = None
         for o in group:
             if obj.isElementVisible(o.Name):
                 shape += Part.getShape(o).Solids
@@ -1487,13 +1994,6 @@ class Assembly(AsmGroup):
             raise RuntimeError('No solids found in parts')
         if len(shape) == 1:
             obj.Shape = shape[0]
-        elif obj.BuildShape == BuildShapeFuse:
-            obj.Shape = shape[0].fuse(shape[1:])
-        elif obj.BuildShape == BuildShapeCut:
-            if len(shape)>2:
-                obj.Shape = shape[0].cut(shape[1].fuse(shape[2:]))
-            else:
-                obj.Shape = shape[0].cut(shape[1])
         else:
             obj.Shape = Part.makeCompound(shape)
 
@@ -1503,17 +2003,33 @@ class Assembly(AsmGroup):
                 "App::PropertyLinkSubHidden","ColoredElements","Base",'')
         obj.setPropertyStatus('ColoredElements',('Hidden','Immutable'))
         obj.BuildShape = BuildShapeNames
+        self.addSolveModeProperty(obj)
         super(Assembly,self).attach(obj)
 
+    @staticmethod
+    def addSolveModeProperty(obj):
+        obj.addProperty("App::PropertyEnumeration","SolveMode","Base",
+            'Rigid: solved on its own, and moved as a whole by the parent.\n'
+            'Flexible: solved together with the parent assembly, so that the\n'
+            'parent constraints can move the assembly as well as its parts.\n'
+            'Not supported when the assembly is referenced through links.')
+        obj.SolveMode = SolveModeNames
+
     def linkSetup(self,obj):
-        self.parts = set()
-        self.partArrays = set()
+        self.cstrParts = {}
+        self.partCstrs = {}
         obj.configLinkProperty('Placement')
         if not hasattr(obj,'ColoredElements'):
             obj.addProperty(
                     "App::PropertyLinkSubHidden","ColoredElements","Base",'')
             obj.setPropertyStatus('ColoredElements',('Hidden','Immutable'))
         obj.configLinkProperty('ColoredElements')
+        # Shape is assigned outside of execute() when built lazily, which
+        # must not touch the assembly
+        obj.setPropertyStatus('Shape','Output')
+        self.shapeStale = True
+        if not hasattr(obj,'SolveMode'):
+            self.addSolveModeProperty(obj)
         super(Assembly,self).linkSetup(obj)
         System.attach(obj)
         self.onChanged(obj,'BuildShape')
@@ -1535,7 +2051,7 @@ class Assembly(AsmGroup):
             return
         if prop not in _IgnoredProperties:
             System.onChanged(obj,prop)
-            Assembly.autoSolve()
+            Assembly.autoSolve(assembly=self)
 
     def getConstraintGroup(self, create=False):
         obj = self.Object
@@ -1572,7 +2088,7 @@ class Assembly(AsmGroup):
                 logger.debug('skip constraint {}'.format(cstrName(o)))
                 continue
             if not System.isConstraintSupported(self.Object,
-                       Constraint.getTypeName(o)):
+                       Constraint.getSolverTypeName(o)):
                 logger.debug('skip unsupported constraint '
                     '{}'.format(cstrName(o)))
                 continue
@@ -1830,6 +2346,8 @@ class ViewProviderAssembly(ViewProviderAsmGroup):
 
     def onDragEnd(self):
         self.__class__._Busy = False
+        if getattr(self,'_movingPart',None):
+            logger.catch('failed to finish trace',self._movingPart.end)
         FreeCAD.closeActiveTransaction()
 
     def unsetEdit(self,_vobj,_mode):
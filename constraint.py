@@ -51,7 +51,7 @@ def _p(solver,partInfo,subname,shape,retAll=False):
     h = partInfo.EntityMap.get(key,None)
     system = solver.system
     if h:
-        system.log('cache {}: {}'.format(key,h))
+        system.log('cache {}: {}',key,h)
         return h if retAll else h.entity
 
     v = utils.getElementPos(shape)
@@ -66,14 +66,14 @@ def _p(solver,partInfo,subname,shape,retAll=False):
         system.NameTag = nameTag
         e = system.addPoint3d(*params)
         h = PointInfo(entity=e,params=params,vector=v)
-        system.log('{}: add draft point {}'.format(key,h))
+        system.log('{}: add draft point {}',key,h)
 
         if system.sketchPlane and not solver.isFixedElement(part,subname):
             system.NameTag = nameTag + '.i'
             e2 = system.addPointInPlane(e,system.sketchPlane.entity,
                 group=partInfo.Group)
-            system.log('{}: add draft point in plane {},{}'.format(
-                partInfo.PartName,e2,system.sketchPlane.entity))
+            system.log('{}: add draft point in plane {},{}',
+                partInfo.PartName,e2,system.sketchPlane.entity)
 
     elif utils.isDraftCircle(part):
         requireArc = subname=='Vertex2'
@@ -86,7 +86,7 @@ def _p(solver,partInfo,subname,shape,retAll=False):
         else:
             raise RuntimeError('Invalid draft circle subname {} of '
                     '{}'.format(subname,partInfo.PartName))
-        system.log('{}: add circle point {}'.format(key,h))
+        system.log('{}: add circle point {}',key,h)
 
     else:
         nameTag = partInfo.PartName + '.' + key
@@ -95,7 +95,7 @@ def _p(solver,partInfo,subname,shape,retAll=False):
         system.NameTag = nameTag + 't'
         h = system.addTransform(e,*partInfo.Params,group=partInfo.Group)
         h = PointInfo(entity=h, params=partInfo.Params,vector=v)
-        system.log('{}: {},{}'.format(key,h,partInfo.Group))
+        system.log('{}: {},{}',key,h,partInfo.Group)
 
     partInfo.EntityMap[key] = h
     return h if retAll else h.entity
@@ -114,7 +114,7 @@ def _n(solver,partInfo,subname,shape,retAll=False):
     h = partInfo.EntityMap.get(key,None)
     system = solver.system
     if h:
-        system.log('cache {}: {}'.format(key,h))
+        system.log('cache {}: {}',key,h)
     else:
         if utils.isDraftCircle(partInfo.Part):
             _prepareDraftCircle(solver,partInfo)
@@ -141,7 +141,7 @@ def _n(solver,partInfo,subname,shape,retAll=False):
         h = NormalInfo(entity=nz,rot=rot,
                 params=partInfo.Params, p0=p0.entity, ln=ln)
 
-        system.log('{}: {},{}'.format(key,h,partInfo.Group))
+        system.log('{}: {},{}',key,h,partInfo.Group)
         partInfo.EntityMap[key] = h
     return h if retAll else h.entity
 
@@ -168,7 +168,7 @@ def _l(solver,partInfo,subname,shape,retAll=False):
     h = partInfo.EntityMap.get(key,None)
     system = solver.system
     if h:
-        system.log('cache {}: {}'.format(key,h))
+        system.log('cache {}: {}',key,h)
     else:
         nameTag = partInfo.PartName + '.' + key
         if utils.isDraftWire(part):
@@ -193,7 +193,7 @@ def _l(solver,partInfo,subname,shape,retAll=False):
         system.NameTag = nameTag
         h = system.addLineSegment(tp0,tp1,group=partInfo.Group)
         h = LineInfo(entity=h,p0=tp0,p1=tp1)
-        system.log('{}: {},{}'.format(key,h,partInfo.Group))
+        system.log('{}: {},{}',key,h,partInfo.Group)
         partInfo.EntityMap[key] = h
 
     return h if retAll else h.entity
@@ -248,14 +248,14 @@ def _w(solver,partInfo,subname,shape,retAll=False):
     h = partInfo.EntityMap.get(key,None)
     system = solver.system
     if h:
-        system.log('cache {}: {}'.format(key,h))
+        system.log('cache {}: {}',key,h)
     else:
         p = _p(solver,partInfo,subname,shape,True)
         n = _n(solver,partInfo,subname,shape,True)
         system.NameTag = partInfo.PartName + '.' + key
         w = system.addWorkplane(p.entity,n.entity,group=partInfo.Group)
         h = PlaneInfo(entity=w,origin=p,normal=n)
-        system.log('{}: {},{}'.format(key,h,partInfo.Group))
+        system.log('{}: {},{}',key,h,partInfo.Group)
     return h if retAll else h.entity
 
 def _wa(solver,partInfo,subname,shape,retAll=False):
@@ -278,7 +278,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
     h = partInfo.EntityMap.get(key,None)
     system = solver.system
     if h:
-        system.log('cache {}: {}'.format(key,h))
+        system.log('cache {}: {}',key,h)
         return h if retAll else h.entity
 
     g = partInfo.Group
@@ -295,8 +295,8 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
             system.NameTag = nameTag + '.i'
             e2 = system.addPointInPlane(
                     pln.origin.entity, system.sketchPlane.entity, group=g)
-            system.log('{}: fix draft circle in plane {},{}'.format(
-                partInfo.PartName,e1,e2))
+            system.log('{}: fix draft circle in plane {},{}',
+                partInfo.PartName,e1,e2)
 
         if part.FirstAngle == part.LastAngle:
             if requireArc:
@@ -310,7 +310,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
             e = system.addCircle(pln.origin.entity, pln.normal.entity,
                                  system.addDistance(r), group=g)
             h = CircleInfo(entity=e,radius=r,p0=p0)
-            system.log('{}: add draft circle {}, {}'.format(key,h,g))
+            system.log('{}: add draft circle {}, {}',key,h,g)
         else:
             system.NameTag = nameTag + '.c'
             center = system.addPoint2d(pln.entity,solver.v0,solver.v0,group=g)
@@ -327,7 +327,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
             system.NameTag = nameTag
             e = system.addArcOfCircle(pln.entity,center,*points,group=g)
             h = ArcInfo(entity=e,p1=points[1],p0=points[0],params=params)
-            system.log('{}: add draft arc {}, {}'.format(key,h,g))
+            system.log('{}: add draft arc {}, {}',key,h,g)
 
             # exhaust all possible keys from a draft circle to save
             # recomputation
@@ -351,7 +351,7 @@ def _c(solver,partInfo,subname,shape,requireArc=False,retAll=False):
             h = system.addCircle(
                     pln.origin.entity, pln.normal.entity, hr, group=g)
             h = CircleInfo(entity=h,radius=hr,p0=None)
-        system.log('{}: {},{}'.format(key,h,g))
+        system.log('{}: {},{}',key,h,g)
 
     partInfo.EntityMap[key] = h
 
@@ -454,7 +454,7 @@ class Constraint(ProxyType):
                    mcs.getType(utils.getLabel(obj)):
                     obj.Label = mcs.getTypeName(obj)
             except Exception as e:
-                logger.debug('auto constraint label failed: {}'.format(e))
+                logger.debug('auto constraint label failed: {}',e)
 
     @classmethod
     def isDisabled(mcs,obj):
@@ -468,6 +468,16 @@ class Constraint(ProxyType):
     def prepare(mcs,obj,solver):
         return mcs.getProxy(obj).prepare(obj,solver)
 
+    @classmethod
+    def getSolverTypeName(mcs,obj):
+        '''
+        Return the constraint type name used to check for solver support
+        '''
+        cstr = mcs.getProxy(obj)
+        if cstr:
+            return cstr.getSolverTypeName()
+        return mcs.getTypeName(obj)
+
     @classmethod
     def getFixedParts(mcs,solver,cstrs,parts):
         firstInfo = None
@@ -492,18 +502,18 @@ class Constraint(ProxyType):
             if not found and not firstInfo:
                 elements = obj.Proxy.getElements()
                 if elements:
-                    firstInfo = elements[0].Proxy.getInfo()
+                    firstInfo = getElementInfo(solver,elements[0])
 
         if not found:
             if not firstInfo or not solver:
                 return ret
             if utils.isDraftObject(firstInfo.Part):
                 Locked.lockElement(firstInfo,solver)
-                logger.debug('lock first draft object {}'.format(
-                    firstInfo.PartName))
+                logger.debug('lock first draft object {}',
+                    firstInfo.PartName)
                 solver.getPartInfo(firstInfo,True,solver.group)
             else:
-                logger.debug('lock first part {}'.format(firstInfo.PartName))
+                logger.debug('lock first part {}',firstInfo.PartName)
                 ret.add(firstInfo.Part)
         return ret
 
@@ -582,6 +592,15 @@ _ordinal = ('1st', '2nd', '3rd', '4th', '5th', '6th', '7th')
 def cstrName(obj):
     return '{}<{}>'.format(objName(obj),Constraint.getTypeName(obj))
 
+def getElementInfo(solver,element):
+    '''
+    Return the information of the constraint element. If there is a solver,
+    let it resolve elements of flexible sub-assemblies.
+    '''
+    if solver:
+        return solver.getElementInfo(element)
+    return element.Proxy.getInfo()
+
 
 class Base(object):
     __metaclass__ = Constraint
@@ -658,7 +677,7 @@ class Base(object):
         entities = cls.getEntityDef(elements,True,obj)
         ret = []
         for e,o in zip(entities,elements):
-            info = o.Proxy.getInfo()
+            info = getElementInfo(solver,o)
             partInfo = solver.getPartInfo(info)
             ret.append(e(solver,partInfo,info.Subname,info.Shape,retAll=retAll))
 
@@ -670,7 +689,7 @@ class Base(object):
                     'or a {} element to define a projection plane'.format(
                     cstrName(obj), _ordinal[len(elements)]))
 
-        solver.system.log('{} entities: {}'.format(cstrName(obj),ret))
+        solver.system.log('{} entities: {}',cstrName(obj),ret)
         return ret
 
     @classmethod
@@ -679,11 +698,15 @@ class Base(object):
         if func:
             params = cls.getPropertyValues(obj) + cls.getEntities(obj,solver)
             ret = func(*params,group=solver.group)
-            solver.system.log('{}: {}'.format(cstrName(obj),ret))
+            solver.system.log('{}: {}',cstrName(obj),ret)
             return ret
         else:
             logger.warn('{} no constraint func'.format(cstrName(obj)))
 
+    @classmethod
+    def getSolverTypeName(cls):
+        return cls.getName()
+
     @classmethod
     def hasFixedPart(cls,_obj):
         return False
@@ -712,10 +735,10 @@ class Locked(Base):
     _tooltip = 'Add a "{}" constraint to fix part(s)'
 
     @classmethod
-    def getFixedParts(cls,_solver,obj):
+    def getFixedParts(cls,solver,obj):
         ret = []
         for e in obj.Proxy.getElements():
-            info = e.Proxy.getInfo()
+            info = getElementInfo(solver,e)
             if not utils.isVertex(info.Shape) and \
                not utils.isLinearEdge(info.Shape) and \
                not utils.isDraftCircle(info.Part):
@@ -777,13 +800,22 @@ class Locked(Base):
             names = [info.Subname+'.fp0', info.Subname+'.fp1']
 
         nameTag = partInfo.PartName + '.' + info.Subname
+        body = solver.getFrameBody()
 
         for i,v in enumerate(info.Shape.Vertexes):
             surfix = '.fp{}'.format(i)
             system.NameTag = nameTag + surfix
 
             # Create an entity for the transformed constant point
-            e1 = system.addPoint3dV(*info.Placement.multVec(v.Point))
+            pt = info.Placement.multVec(v.Point)
+            if body:
+                # The element belongs to a flexible sub-assembly, so fix the
+                # point relative to the body of the sub-assembly
+                e1 = system.addPoint3dV(*body.Placement.inverse().multVec(pt))
+                system.NameTag = nameTag + surfix + 't'
+                e1 = system.addTransform(e1,*body.Params,group=body.Group)
+            else:
+                e1 = system.addPoint3dV(*pt)
 
             # Get the entity for the point expressed in variable parameters
             e2 = _p(solver,partInfo,names[i],v)
@@ -799,8 +831,8 @@ class Locked(Base):
                 else:
                     w = 0
                 e = system.addPointsCoincident(e1,e2,w,group=solver.group)
-                system.log('{}: fix point {},{},{}'.format(
-                    info.PartName,e,e1,e2))
+                system.log('{}: fix point {},{},{}',
+                    info.PartName,e,e1,e2)
             else:
                 # The second point, so we are fixing a linear edge. We can't
                 # add a second coincidence constraint, which will cause
@@ -813,7 +845,7 @@ class Locked(Base):
                 system.NameTag = nameTag
                 # Now, constraint the second variable point to the line
                 e = system.addPointOnLine(e2,l,group=solver.group)
-                system.log('{}: fix line {},{}'.format(info.PartName,e,l))
+                system.log('{}: fix line {},{}',info.PartName,e,l)
 
             ret.append(e)
 
@@ -823,7 +855,7 @@ class Locked(Base):
     def prepare(cls,obj,solver):
         ret = []
         for element in obj.Proxy.getElements():
-            ret += cls.lockElement(element.Proxy.getInfo(),solver)
+            ret += cls.lockElement(getElementInfo(solver,element),solver)
         return ret
 
     @classmethod
@@ -861,7 +893,7 @@ class BaseMulti(Base):
         props = cls.getPropertyValues(obj)
 
         for e in obj.Proxy.getElements():
-            info = e.Proxy.getInfo()
+            info = getElementInfo(solver,e)
             if info.Part in parts:
                 logger.warn('{} skip duplicate parts {}'.format(
                     cstrName(obj),info.PartName))
@@ -883,7 +915,7 @@ class BaseMulti(Base):
         ret = []
         firstInfo = None
         for e in elements:
-            info = e.Proxy.getInfo()
+            info = getElementInfo(solver,e)
             partInfo = solver.getPartInfo(info)
             if not e0:
                 e0 = cls._entityDef[0](solver,partInfo,info.Subname,info.Shape)
@@ -913,7 +945,7 @@ class BaseCascade(BaseMulti):
         prev = None
         ret = []
         for e in obj.Proxy.getElements():
-            info = e.Proxy.getInfo()
+            info = getElementInfo(solver,e)
             if not prev or prev.Part==info.Part:
                 prev = info
                 continue
@@ -926,7 +958,7 @@ class BaseCascade(BaseMulti):
                 params = props + [e1,e2]
             else:
                 params = props + [e2,e1]
-            solver.system.checkRedendancy(obj,prevInfo,partInfo)
+            solver.system.checkRedundancy(obj,prevInfo,partInfo)
             h = func(*params,group=solver.group)
             if isinstance(h,(list,tuple)):
                 ret += list(h)
@@ -943,7 +975,7 @@ class PlaneCoincident(BaseCascade):
     _iconName = 'Assembly_ConstraintCoincidence.svg'
     _props = ['Cascade','Offset','OffsetX','OffsetY'] + _AngleProps
     _tooltip = \
-        'Add a "{}" constraint to conincide planes of two or more parts.\n'\
+        'Add a "{}" constraint to coincide planes of two or more parts.\n'\
         'The planes are coincided at their centers with an optional distance.'
 
 class PlaneAlignment(BaseCascade):
@@ -980,6 +1012,136 @@ class MultiParallel(BaseMulti):
         'of two or more parts parallel.'
 
 
+class BasePattern(Base):
+    '''
+    Base class of constraints applied to every element of a link array
+
+    The second element must reference an element of any one of the array
+    elements. The constraint is expanded to the same element of every array
+    element, and each one is constrained against the first element. If the
+    first element also comes from a link array, the two arrays are paired by
+    array index.
+    '''
+    _id = -1
+    _baseType = None
+
+    @classmethod
+    def getSolverTypeName(cls):
+        return cls._baseType.getName()
+
+    @classmethod
+    def constraintFunc(cls,obj,solver):
+        return cls._baseType.constraintFunc(obj,solver)
+
+    @classmethod
+    def check(cls,elements,checkCount=False):
+        if len(elements)>2 or (checkCount and len(elements)<2):
+            raise RuntimeError('Constraint "{}" requires exactly two '
+                'elements'.format(cls.getName()))
+        for i,info in enumerate(elements):
+            msg = cls._baseType._entityDef[0](
+                    None,info.Part,info.Subname,info.Shape)
+            if msg:
+                raise RuntimeError('Constraint "{}" requires the {} element '
+                    'to be {}'.format(cls.getName(), _ordinal[i], msg))
+        if len(elements)==2:
+            # only check the array-ness here, leave the expansion to prepare()
+            from .assembly import getArrayElementCount
+            if not getArrayElementCount(elements[1]):
+                raise RuntimeError('Constraint "{}" requires the 2nd element '
+                    'to be from a link array'.format(cls.getName()))
+
+    @classmethod
+    def prepare(cls,obj,solver):
+        func = cls.constraintFunc(obj,solver)
+        if not func:
+            logger.warn('{} no constraint func'.format(cstrName(obj)))
+            return
+        elements = obj.Proxy.getElements()
+        if len(elements)!=2:
+            logger.warn('{} requires two elements'.format(cstrName(obj)))
+            return
+
+        # The array elements are expanded from the unresolved element
+        # information, and then resolved for the solver
+        from .assembly import getArrayElementInfo
+        infos = getArrayElementInfo(elements[1].Proxy.getInfo())
+        if not infos:
+            logger.warn('{} requires the 2nd element to be from a link '
+                'array'.format(cstrName(obj)))
+            return
+        infos = [solver.resolveInfo(info) for info in infos]
+        bases = getArrayElementInfo(elements[0].Proxy.getInfo())
+        if bases:
+            if len(bases)!=len(infos):
+                logger.warn('{} array size mismatch, {} vs {}'.format(
+                    cstrName(obj),len(bases),len(infos)))
+            pairs = zip([solver.resolveInfo(info) for info in bases],infos)
+        else:
+            base = getElementInfo(solver,elements[0])
+            pairs = [(base,info) for info in infos]
+
+        # Same element ordering as the base type. BaseCascade puts the fixed
+        # part second, while BaseMulti puts it first.
+        cascade = issubclass(cls._baseType,BaseCascade)
+        entity = cls._baseType._entityDef[0]
+        props = cls.getPropertyValues(obj)
+        batch = []
+        for info1,info2 in pairs:
+            if info1.Part == info2.Part:
+                continue
+            partInfo1 = solver.getPartInfo(info1)
+            e1 = entity(solver,partInfo1,info1.Subname,info1.Shape)
+            partInfo2 = solver.getPartInfo(info2)
+            e2 = entity(solver,partInfo2,info2.Subname,info2.Shape)
+            fixed = solver.isFixedPart(info2.Part)
+            if cascade:
+                swap = not fixed
+            else:
+                swap = fixed and not solver.isFixedPart(info1.Part)
+            if swap:
+                batch.append((partInfo2,partInfo1,props+[e2,e1]))
+            else:
+                batch.append((partInfo1,partInfo2,props+[e1,e2]))
+
+        ret = solver.system.addConstraints(obj,func,batch,solver.group)
+        if not ret:
+            logger.warn('{} has no effective constraint'.format(cstrName(obj)))
+        solver.system.log('{}: {} array constraints',
+            cstrName(obj),len(ret))
+        return ret
+
+
+class PatternCoincident(BasePattern):
+    _id = 40
+    _baseType = PlaneCoincident
+    _iconName = 'Assembly_ConstraintCoincidence.svg'
+    _props = ['Offset','OffsetX','OffsetY'] + _AngleProps
+    _tooltip = \
+        'Add a "{}" constraint to coincide the planes of every element of\n'\
+        'a link array with the plane of the first element.'
+
+
+class PatternAlignment(BasePattern):
+    _id = 41
+    _baseType = PlaneAlignment
+    _iconName = 'Assembly_ConstraintAlignment.svg'
+    _props = ['Offset'] + _AngleProps
+    _tooltip = \
+        'Add a "{}" constraint to align the planes of every element of a\n'\
+        'link array with the plane of the first element.'
+
+
+class PatternAxialAlignment(BasePattern):
+    _id = 42
+    _baseType = AxialAlignment
+    _iconName = 'Assembly_ConstraintAxial.svg'
+    _props = _AngleProps
+    _tooltip = \
+        'Add a "{}" constraint to align the axes of every element of a\n'\
+        'link array with the axis of the first element.'
+
+
 class Base2(Base):
     _id = -1
     _toolbarName = 'Assembly3 Constraints2'
@@ -1039,7 +1201,7 @@ class PointsCoincident(Base2):
     _entityDef = (_p,_p)
     _workplane = True
     _iconName = 'Assembly_ConstraintPointsCoincident.svg'
-    _tooltip = 'Add a "{}" constraint to conincide two points.'
+    _tooltip = 'Add a "{}" constraint to coincide two points.'
 
 
 class PointInPlane(Base2):
@@ -1272,7 +1434,7 @@ class LineLength(BaseSketch):
             _,p0,p1 = cls.getEntities(obj,solver,retAll=True)[0]
             params = cls.getPropertyValues(obj) + [p0,p1]
             ret = func(*params,group=solver.group)
-            solver.system.log('{}: {}'.format(cstrName(obj),ret))
+            solver.system.log('{}: {}',cstrName(obj),ret)
             return ret
         else:
             logger.warn('{} no constraint func'.format(cstrName(obj)))
@@ -1,14 +1,20 @@
 from collections import OrderedDict
 import FreeCAD, FreeCADGui
+from PySide import QtCore
 from .utils import getElementPos,objName,addIconToFCAD,guilogger as logger
 from .proxy import ProxyType
 from .FCADLogger import FCADLogger
 
 class SelectionObserver:
+    _cache = None
+
     def __init__(self):
         self._attached = False
+        self._pending = False
         self.cmds = []
         self.elements = dict()
+        self.visChanges = OrderedDict()
+        self._visPending = False
         self.attach()
         self.busy = False;
 
@@ -16,27 +22,130 @@ class SelectionObserver:
         self.cmds = cmds
 
     def onChanged(self):
-        for cmd in self.cmds:
-            cmd.checkActive()
-
-    def _setElementVisible(self,obj,subname,vis):
+        # Coalesce the selection events, e.g. of box selection, and check the
+        # commands once in the next event loop turn
+        if not self._pending:
+            self._pending = True
+            QtCore.QTimer.singleShot(0,self.checkActive)
+
+    def checkActive(self):
+        self._pending = False
+        SelectionObserver._cache = {}
+        try:
+            for cmd in self.cmds:
+                cmd.checkActive()
+        finally:
+            SelectionObserver._cache = None
+
+    @classmethod
+    def getCached(cls,key,func,*args):
+        '''
+        Return the result of func(*args), which is cached during one pass of
+        command checking, so that selection parsing shared by several
+        commands is done only once. Exception is cached and raised as well.
+        '''
+        cache = cls._cache
+        if cache is None:
+            return func(*args)
+        ret = cache.get(key,None)
+        if ret is None:
+            try:
+                ret = (True,func(*args))
+            except Exception as e:
+                ret = (False,e)
+            cache[key] = ret
+        if not ret[0]:
+            raise ret[1]
+        return ret[1]
+
+    def _getElementParent(self,obj,subname):
+        '''
+        Return a tuple(parent,childName) for changing the visibility of the
+        selected element or constraint. 'childName' is None for a constraint,
+        meaning all of its children.
+        '''
         sobj = obj.getSubObject(subname,1)
         from .assembly import isTypeOf,AsmConstraint,\
                 AsmElement,AsmElementLink
         if isTypeOf(sobj,(AsmElement,AsmElementLink)):
-            res = sobj.Proxy.parent.Object.isElementVisible(sobj.Name)
-            if res and vis:
-                return False
-            sobj.Proxy.parent.Object.setElementVisible(sobj.Name,vis)
+            return sobj.Proxy.parent.Object,sobj.Name
         elif isTypeOf(sobj,AsmConstraint):
-            vis = [vis] * len(sobj.Group)
-            sobj.setPropertyStatus('VisibilityList','-Immutable')
-            sobj.VisibilityList = vis
-            sobj.setPropertyStatus('VisibilityList','Immutable')
-        else:
+            return sobj,None
+        return None,None
+
+    def _setElementVisible(self,key,obj,subname,vis,presel):
+        parent,name = self._getElementParent(obj,subname)
+        if not parent:
             return
-        if vis:
-            FreeCADGui.Selection.updateSelection(vis,obj,subname)
+        if vis and presel and name:
+            change = self.visChanges.get(key,None)
+            if change:
+                visible = change[2]
+            else:
+                visible = parent.isElementVisible(name)
+            if visible:
+                return False
+        # The changes are accumulated and applied in the next event loop
+        # turn, with the later change of the same element overriding
+        self.visChanges.pop(key,None)
+        self.visChanges[key] = (parent,name,vis,obj,subname)
+        if not self._visPending:
+            self._visPending = True
+            QtCore.QTimer.singleShot(0,self.applyElementVisible)
+
+    @staticmethod
+    def _applyVisibility(parent,changes):
+        '''
+        Apply the visibility changes, dict(childName->vis), to the children
+        of the parent object with a single VisibilityList assignment
+        '''
+        children = parent.Group
+        visList = list(parent.VisibilityList)
+        if len(visList) != len(children):
+            for name,vis in changes.items():
+                if parent.isElementVisible(name) != vis:
+                    parent.setElementVisible(name,vis)
+            return
+        changed = False
+        for i,o in enumerate(children):
+            vis = changes.get(o.Name,None)
+            if vis is not None and visList[i] != vis:
+                visList[i] = vis
+                changed = True
+        if not changed:
+            return
+        immutable = 'Immutable' in parent.getPropertyStatus('VisibilityList')
+        if immutable:
+            parent.setPropertyStatus('VisibilityList','-Immutable')
+        parent.VisibilityList = visList
+        if immutable:
+            parent.setPropertyStatus('VisibilityList','Immutable')
+
+    def applyElementVisible(self):
+        self._visPending = False
+        changes = self.visChanges
+        self.visChanges = OrderedDict()
+        parents = OrderedDict()
+        selections = []
+        for parent,name,vis,obj,subname in changes.values():
+            try:
+                key = (parent.Document.Name,parent.Name)
+            except Exception:
+                # deleted
+                continue
+            children = parents.setdefault(key,(parent,{}))[1]
+            if name:
+                children[name] = vis
+            else:
+                for o in parent.Group:
+                    children[o.Name] = vis
+            if vis:
+                selections.append((obj,subname))
+        for parent,children in parents.values():
+            logger.catchWarn('',self._applyVisibility,parent,children)
+        for obj,subname in selections:
+            logger.catchWarn('',FreeCADGui.Selection.updateSelection,
+                    True,obj,subname)
 
     def setElementVisible(self,docname,objname,subname,vis,presel=False):
         if not AsmCmdManager.AutoElementVis:
@@ -55,7 +164,7 @@ class SelectionObserver:
             if val is None or (presel and val):
                 return
         if logger.catchWarn('',self._setElementVisible,
-                obj,subname,vis) is False and presel:
+                key,obj,subname,vis,presel) is False:
             return
         if not vis:
             self.elements.pop(key,None)
@@ -74,7 +183,8 @@ class SelectionObserver:
             obj = doc.getObject(objname)
             if not obj:
                 continue
-            logger.catchWarn('',self._setElementVisible,obj,subname,False)
+            logger.catchWarn('',self._setElementVisible,
+                    (docname,objname,subname),obj,subname,False,False)
 
     def addSelection(self,docname,objname,subname,_pos):
         self.onChanged()
@@ -399,6 +509,38 @@ class AsmCmdAutoElementVis(AsmCmdCheckable):
                     obj.ViewObject.OnTopWhenSelected = 2
 
 
+class AsmCmdDumpEvents(AsmCmdBase):
+    _id = 16
+    _menuText = 'Dump solver events'
+    _tooltip = 'Print the recently recorded solver events to the console'
+    _iconName = 'Assembly_Assembly_Constraints_Tree.svg'
+    _toolbarName = None
+    _contextMenuName = None
+
+    @classmethod
+    def Activated(cls):
+        from . import solver
+        logger.report('command "{}" exception'.format(cls.getName()),
+                solver.dumpEvents)
+
+
+class AsmCmdBuildShape(AsmCmdBase):
+    _id = 17
+    _menuText = 'Build assembly shape'
+    _tooltip = 'Build the shape of the selected assemblies, or all assemblies\n'\
+               'of the active document if none is selected. The assembly\n'\
+               'shape is otherwise built after recompute.'
+    _iconName = 'Assembly_Assembly_Tree.svg'
+    _toolbarName = None
+    _contextMenuName = None
+
+    @classmethod
+    def Activated(cls):
+        from . import assembly
+        logger.report('command "{}" exception'.format(cls.getName()),
+                assembly.Assembly.buildShapes)
+
+
 class AsmCmdAddWorkplane(AsmCmdBase):
     _id = 8
     _menuText = 'Add workplane'
@@ -411,6 +553,7 @@ class AsmCmdAddWorkplane(AsmCmdBase):
     def checkActive(cls):
         from . import assembly
         if logger.catchTrace('Add workplane selection',
+                SelectionObserver.getCached,'AddWorkplane',
                 assembly.AsmWorkPlane.getSelection):
             cls._active = True
         else:
@@ -484,7 +627,8 @@ class AsmCmdUp(AsmCmdBase):
 
     @classmethod
     def checkActive(cls):
-        cls._active = True if cls.getSelection() else False
+        cls._active = True if SelectionObserver.getCached(
+                'MoveItem',cls.getSelection) else False
 
     @classmethod
     def move(cls,step):
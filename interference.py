@@ -0,0 +1,247 @@
+'''
+Interference checking of solved part placement trajectories
+
+The trajectories are usually obtained by solver.sweep(). For each step, the
+part bounding boxes are transformed by the part placements, and a bounding
+volume hierarchy is built over them to cull the part pairs that cannot
+possibly interfere. Only the remaining candidate pairs are checked using the
+exact shapes, in worker processes if possible.
+'''
+
+import time
+from collections import namedtuple
+import FreeCAD, Part
+import numpy as np
+from . import parallel
+from .utils import logger, objName
+
+# Step: the index of the step in the trajectory
+# Part1, Part2: the names of the interfering parts
+# Value: the volume of the common solid, or the minimum distance if checking
+#        with clearance
+Interference = namedtuple('AsmInterference',('Step','Part1','Part2','Value'))
+
+class BVH(object):
+    '''
+    Bounding volume hierarchy of axis aligned boxes
+
+    boxes: a NumPy array of shape (n,6), with each row being (xmin,ymin,zmin,
+    xmax,ymax,zmax)
+    '''
+    def __init__(self,boxes,leafSize=4):
+        self.boxes = boxes
+        # each node is a list [lower,upper,left,right,items], with 'items'
+        # being None for non-leaf nodes
+        self.nodes = []
+        self.root = -1
+        if len(boxes):
+            self.root = self._build(np.arange(len(boxes)),leafSize)
+
+    def _build(self,items,leafSize):
+        boxes = self.boxes[items]
+        lower = boxes[:,:3].min(axis=0)
+        upper = boxes[:,3:].max(axis=0)
+        idx = len(self.nodes)
+        node = [lower,upper,-1,-1,items]
+        self.nodes.append(node)
+        if len(items) > leafSize:
+            # median split along the longest axis
+            axis = np.argmax(upper-lower)
+            order = np.argsort(boxes[:,axis]+boxes[:,axis+3],kind='mergesort')
+            half = len(items)//2
+            node[2] = self._build(items[order[:half]],leafSize)
+            node[3] = self._build(items[order[half:]],leafSize)
+            node[4] = None
+        return idx
+
+    @staticmethod
+    def _overlap(n1,n2):
+        return np.all(n1[0]<=n2[1]) and np.all(n2[0]<=n1[1])
+
+    def _leafPairs(self,items1,items2,same):
+        b1 = self.boxes[items1]
+        b2 = self.boxes[items2]
+        hit = np.all(b1[:,None,:3]<=b2[None,:,3:],axis=2) & \
+              np.all(b2[None,:,:3]<=b1[:,None,3:],axis=2)
+        if same:
+            hit = np.triu(hit,1)
+        return [(items1[i],items2[j]) for i,j in zip(*np.nonzero(hit))]
+
+    def getPairs(self):
+        'Return a list of index pairs of the overlapping boxes'
+        ret = []
+        if self.root < 0:
+            return ret
+        nodes = self.nodes
+        stack = [(self.root,self.root)]
+        while stack:
+            a,b = stack.pop()
+            n1,n2 = nodes[a],nodes[b]
+            if a!=b and not self._overlap(n1,n2):
+                continue
+            if n1[4] is not None and n2[4] is not None:
+                ret += self._leafPairs(n1[4],n2[4],a==b)
+            elif a == b:
+                left,right = n1[2],n1[3]
+                stack += [(left,left),(right,right),(left,right)]
+            elif n2[4] is not None or (n1[4] is None and
+                    np.prod(n1[1]-n1[0]) >= np.prod(n2[1]-n2[0])):
+                stack += [(n1[2],b),(n1[3],b)]
+            else:
+                stack += [(a,n2[2]),(a,n2[3])]
+        return [(min(i,j),max(i,j)) for i,j in ret]
+
+
+def getPartShapes(assembly,names):
+    '''
+    Return a list of shapes of the named parts of the assembly, without the
+    part placement, i.e. in part local coordinate system
+    '''
+    partGroup = assembly.Proxy.getPartGroup()
+    ret = []
+    for name in names:
+        subname = name if name.endswith('.') else name+'.'
+        shape = Part.getShape(partGroup,subname,transform=False)
+        if shape.isNull():
+            raise RuntimeError('no shape of part {} in {}'.format(
+                name,objName(assembly)))
+        shape = shape.copy()
+        shape.Placement = FreeCAD.Placement()
+        ret.append(shape)
+    return ret
+
+def _getCorners(shapes):
+    return np.array([[tuple(bbox.getPoint(i)) for i in range(8)]
+        for bbox in [shape.BoundBox for shape in shapes]])
+
+def getBoundBoxes(shapes,trajectory,step,clearance=0.0):
+    '''
+    Return the world axis aligned bounding boxes of the shapes at the given
+    step of the trajectory as a NumPy array of shape (n,6)
+    '''
+    return _transformBoxes(_getCorners(shapes),trajectory[step],clearance)
+
+def _rotationMatrices(q):
+    x,y,z,w = q[:,0],q[:,1],q[:,2],q[:,3]
+    n = np.sqrt(x*x+y*y+z*z+w*w)
+    n[n==0] = 1.0
+    x,y,z,w = x/n,y/n,z/n,w/n
+    return np.stack([
+        np.stack([1-2*(y*y+z*z),2*(x*y-z*w),2*(x*z+y*w)],axis=-1),
+        np.stack([2*(x*y+z*w),1-2*(x*x+z*z),2*(y*z-x*w)],axis=-1),
+        np.stack([2*(x*z-y*w),2*(y*z+x*w),1-2*(x*x+y*y)],axis=-1)],axis=1)
+
+def _transformBoxes(corners,placements,clearance):
+    # corners: (n,8,3), placements: (n,7)
+    rot = _rotationMatrices(placements[:,3:])
+    pts = np.einsum('nij,nkj->nki',rot,corners) + placements[:,None,:3]
+    half = 0.5*clearance
+    return np.concatenate([pts.min(axis=1)-half,pts.max(axis=1)+half],axis=1)
+
+def _makePlacement(v):
+    return FreeCAD.Placement(FreeCAD.Vector(*v[:3]),FreeCAD.Rotation(*v[3:]))
+
+def _checkPair(shape1,shape2,pla1,pla2,clearance,tolerance):
+    shape1 = shape1.copy()
+    shape1.Placement = _makePlacement(pla1)
+    shape2 = shape2.copy()
+    shape2.Placement = _makePlacement(pla2)
+    if clearance > 0:
+        d = shape1.distToShape(shape2)[0]
+        return d if d < clearance else None
+    v = shape1.common(shape2).Volume
+    return v if v > tolerance else None
+
+def getCandidates(shapes,trajectory,clearance=0.0,ignore=None):
+    '''
+    Return a list of tuple(step,i,j) of part index pairs with overlapping
+    bounding boxes at each step of the trajectory
+    '''
+    corners = _getCorners(shapes)
+    ret = []
+    for step in range(len(trajectory)):
+        bvh = BVH(_transformBoxes(corners,trajectory[step],clearance))
+        for i,j in bvh.getPairs():
+            if not ignore or (i,j) not in ignore:
+                ret.append((step,i,j))
+    return ret
+
+def check(assembly,names,trajectory,clearance=0.0,tolerance=1e-6,
+        ignore=None,useParallel=True):
+    '''
+    Check part interference over solved placement trajectories
+
+    assembly: the assembly object
+
+    names, trajectory: the part names and placement trajectories, as
+    returned by solver.sweep()
+
+    clearance: if greater than zero, report part pairs closer than this
+    distance, or else report part pairs with common volume
+
+    tolerance: the minimum common volume to report
+
+    ignore: optional list of tuple(name1,name2) of part pairs to skip, e.g.
+    parts that are in contact by design
+
+    useParallel: whether to run exact checking in worker processes
+
+    Return a list of Interference sorted by step
+    '''
+    stamp = time.time()
+    trajectory = np.asarray(trajectory,dtype=float)
+    shapes = getPartShapes(assembly,names)
+    index = dict([(name,i) for i,name in enumerate(names)])
+    ignored = set()
+    for name1,name2 in ignore or []:
+        i,j = index[name1],index[name2]
+        ignored.add((min(i,j),max(i,j)))
+
+    candidates = getCandidates(shapes,trajectory,clearance,ignored)
+    logger.debug('{} interference candidates of {} parts over {} steps, '
+            'culled in {:.3f}s',len(candidates),len(names),len(trajectory),
+            time.time()-stamp)
+
+    results = None
+    if useParallel and len(candidates)>1 and parallel.isSupported():
+        results = logger.catch('parallel interference checking failed',
+                _checkParallel,shapes,trajectory,candidates,
+                clearance,tolerance)
+    if results is None:
+        results = []
+        for step,i,j in candidates:
+            v = _checkPair(shapes[i],shapes[j],trajectory[step,i],
+                    trajectory[step,j],clearance,tolerance)
+            if v is not None:
+                results.append((step,i,j,v))
+
+    ret = [Interference(Step=step,Part1=names[i],Part2=names[j],Value=v)
+            for step,i,j,v in sorted(results)]
+    logger.record('info','interference',assembly.Name,'',len(candidates),
+            len(ret),time.time()-stamp)
+    return ret
+
+def _checkParallel(shapes,trajectory,candidates,clearance,tolerance):
+    count = parallel.getWorkerCount(len(candidates))
+    chunks = [candidates[i::count] for i in range(count)]
+    tasks = []
+    for chunk in chunks:
+        used = sorted(set([i for _,i,_ in chunk] + [j for _,_,j in chunk]))
+        breps = dict([(i,shapes[i].exportBrepToString()) for i in used])
+        tasks.append((breps,[(step,i,j,list(trajectory[step,i]),
+                                list(trajectory[step,j]))
+                            for step,i,j in chunk],clearance,tolerance))
+    ret = []
+    for chunk,result in zip(chunks,parallel.runAll(parallel.checkShapes,tasks)):
+        if result is None or isinstance(result,Exception):
+            if isinstance(result,Exception):
+                logger.warn('interference worker failed: {}',result)
+            # check in this process instead
+            for step,i,j in chunk:
+                v = _checkPair(shapes[i],shapes[j],trajectory[step,i],
+                        trajectory[step,j],clearance,tolerance)
+                if v is not None:
+                    ret.append((step,i,j,v))
+        else:
+            ret += [tuple(r) for r in result]
+    return ret
@@ -1,5 +1,6 @@
-import math
+import math, time
 from collections import namedtuple
+import numpy as np
 import FreeCAD, FreeCADGui
 from PySide import QtCore, QtGui
 from . import utils, gui
@@ -11,6 +12,112 @@ from .constraint import Constraint
 MovingPartInfo = namedtuple('MovingPartInfo',
         ('Hierarchy','ElementInfo','SelObj','SelSubname'))
 
+class AsmTraceRecorder(object):
+    '''
+    Record the trace of a moving point as a Part::Polygon
+
+    The points are buffered in a NumPy array. A new point closer than
+    'minDistance' to the last recorded point is not recorded, and a point
+    that continues in the direction of the last segment within the angle
+    tolerance extends the segment instead. The polygon is updated at most
+    once every _UpdateInterval seconds while moving, and with the complete
+    node list on finish().
+    '''
+    _UpdateInterval = 0.1
+    _AngleTolerance = 1.0 # in degree
+
+    def __init__(self,minDistance=1e-5):
+        self.minDistance = max(minDistance,1e-5)
+        self.cosTolerance = math.cos(math.radians(self._AngleTolerance))
+        self.trace = None
+        self.points = np.zeros((64,3))
+        self.count = 0
+        # unit direction of the last segment
+        self.direction = None
+        # last point skipped because of being too close
+        self.pending = None
+        self.stamp = 0.0
+        self.changed = False
+
+    def _append(self,pt):
+        n = self.count
+        if n == len(self.points):
+            self.points = np.concatenate([self.points,np.zeros_like(self.points)])
+        self.points[n] = pt
+        self.count = n+1
+
+    def add(self,pos,force=False):
+        pt = np.array((pos.x,pos.y,pos.z))
+        n = self.count
+        if not n:
+            self._append(pt)
+            return
+        d = pt - self.points[n-1]
+        dist = np.linalg.norm(d)
+        if dist < 1e-7 or (not force and dist < self.minDistance):
+            self.pending = pt
+            return
+        self.pending = None
+        self.changed = True
+        d /= dist
+        if n>1 and self.direction is not None and \
+           np.dot(d,self.direction) >= self.cosTolerance:
+            # extend the last segment, whose direction stays the same, so
+            # that the deviation cannot accumulate
+            self.points[n-1] = pt
+        else:
+            self._append(pt)
+            self.direction = d
+
+    def _getTrace(self):
+        if self.trace:
+            try:
+                # check if the object is deleted
+                self.trace.Name
+                return self.trace
+            except Exception:
+                # start a new trace from the last point
+                self.trace = None
+                self.points[0] = self.points[self.count-1]
+                self.count = 1
+                self.direction = None
+                return
+        self.trace = FreeCAD.ActiveDocument.addObject(
+                'Part::Polygon','AsmTrace')
+        return self.trace
+
+    def update(self,force=False):
+        if not self.changed:
+            return
+        if not force and time.time()-self.stamp < self._UpdateInterval:
+            return
+        if self.count < 2 or not self._getTrace():
+            return
+        self.changed = False
+        self.trace.Nodes = [FreeCAD.Vector(*pt)
+                                for pt in self.points[:self.count]]
+        self.trace.recompute()
+        self.stamp = time.time()
+
+    def finish(self):
+        if self.pending is not None:
+            self.add(FreeCAD.Vector(*self.pending),True)
+        self.update(True)
+
+    def restart(self,pos):
+        '''
+        Finish the current trace, and start a new one from the given
+        position, so that a jump of the moving point is not recorded
+        '''
+        self.finish()
+        self.trace = None
+        self.points[0] = (pos.x,pos.y,pos.z)
+        self.count = 1
+        self.direction = None
+        self.pending = None
+        self.changed = False
+
+
 class AsmMovingPart(object):
     def __init__(self,hierarchy,info):
         self.objs = [h.Assembly for h in reversed(hierarchy)]
@@ -57,8 +164,7 @@ class AsmMovingPart(object):
         self.offset = pla.copy()
         self.offsetInv = pla.inverse()
         self.draggerPlacement = info.Placement.multiply(pla)
-        self.trace = None
-        self.tracePoint = None
+        self.tracer = None
 
     @classmethod
     def onRollback(cls):
@@ -70,10 +176,19 @@ class AsmMovingPart(object):
             movingPart = getattr(vobj.Proxy,'_movingPart',None)
             if movingPart:
                 vobj.Object.recompute(True)
-                movingPart.tracePoint = movingPart.TracePosition
+                if movingPart.tracer:
+                    # the part jumps back, do not connect the trace
+                    movingPart.tracer.restart(movingPart.TracePosition)
 
     def begin(self):
-        self.tracePoint = self.TracePosition
+        if gui.AsmCmdManager.Trace:
+            if not self.tracer:
+                self.tracer = AsmTraceRecorder(self.bbox.DiagonalLength*1e-3)
+            self.tracer.add(self.TracePosition)
+
+    def end(self):
+        if self.tracer:
+            self.tracer.finish()
 
     def update(self):
         info = getElementInfo(self.info.Parent,self.info.SubnameRef)
@@ -187,20 +302,10 @@ class AsmMovingPart(object):
             obj.recompute(True)
 
         if gui.AsmCmdManager.Trace:
-            pos = self.TracePosition
-            if not self.tracePoint.isEqual(pos,1e-5):
-                try:
-                    # check if the object is deleted
-                    self.trace.Name
-                except Exception:
-                    self.trace = None
-                if not self.trace:
-                    self.trace = FreeCAD.ActiveDocument.addObject(
-                        'Part::Polygon','AsmTrace')
-                    self.trace.Nodes = [self.tracePoint]
-                self.tracePoint = pos
-                self.trace.Nodes = {-1:pos}
-                self.trace.recompute()
+            if not self.tracer:
+                self.tracer = AsmTraceRecorder(self.bbox.DiagonalLength*1e-3)
+            self.tracer.add(self.TracePosition)
+            self.tracer.update()
 
         # self.draggerPlacement, which holds the intended dragger placement, is
         # updated by the above solver call through the following chain, 
@@ -291,7 +396,8 @@ def getMovingElementInfo():
     raise RuntimeError('not child parent selection')
 
 def canMovePart():
-    return logger.catchTrace('',getMovingElementInfo) is not None
+    return gui.SelectionObserver.getCached('MovePart',
+            logger.catchTrace,'',getMovingElementInfo) is not None
 
 def movePart(useCenterballDragger=None):
     ret = logger.catch('exception when moving part', getMovingElementInfo)
@@ -311,6 +417,9 @@ def movePart(useCenterballDragger=None):
     return doc.setEdit(vobj,1)
 
 class AsmQuickMover:
+    # Interval in ms to sample the cursor position, about once per frame
+    _FrameInterval = 16
+
     def __init__(self, info):
         self.info = info.ElementInfo
         idx = len(self.info.Subname)
@@ -337,16 +446,46 @@ class AsmQuickMover:
                 "SoKeyboardEvent",self.keyboardEvent)
         FreeCAD.setActiveTransaction('Assembly quick move')
         self.active = True
+        # Mouse move events may come in much faster than the screen refresh.
+        # So only remember the latest cursor position here, and update the
+        # placement with the frame timer.
+        self.position = None
+        self.lastPosition = None
+        self.timer = QtCore.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.update)
 
     def moveMouse(self, info):
+        self.position = tuple(info['Position'])
+        if not self.timer.isActive():
+            self.timer.start(self._FrameInterval)
+
+    def update(self):
+        # The timer fires in the GUI thread, so it never interrupts a solve
+        if not self.active:
+            return
+        self.writePlacement()
+
+    def writePlacement(self):
+        position,self.position = self.position,None
+        if position is None or position == self.lastPosition:
+            return
+        self.lastPosition = position
         pla = self.info.Placement
-        pos = self.view.getPoint(*info['Position'])
+        pos = self.view.getPoint(*position)
         pla.Base = self.matrix.multiply(pos-self.offset)
+        # This triggers Assembly.checkPartChange(), which (re)schedules the
+        # single pending auto solve
         setPlacement(self.info.Part,pla)
 
     def removeCallbacks(self, abort=False):
         if not self.active:
             return
+        self.timer.stop()
+        if not abort:
+            # flush the pending position regardless of the solver state, or
+            # the last move may be lost on confirm
+            logger.catch('exception when moving part',self.writePlacement)
         self.view.removeEventCallback("SoLocation2Event",self.callbackMove)
         self.view.removeEventCallback("SoMouseButtonEvent",self.callbackClick)
         self.view.removeEventCallback("SoKeyboardEvent",self.callbackKey)
@@ -394,6 +533,12 @@ class AsmDocumentObserver:
     def slotChangedObject(self,obj,prop):
         Assembly.checkPartChange(obj,prop)
 
+    def slotRecomputedDocument(self,doc):
+        Assembly.onRecomputedDocument(doc)
+
+    def slotStartSaveDocument(self,doc,_filename):
+        Assembly.onSaveDocument(doc)
+
 
 def quickMove():
     ret = logger.catch('exception when moving part', getMovingElementInfo)
@@ -0,0 +1,246 @@
+'''
+Helpers for running solver workloads in parallel worker processes
+
+This module is imported by the worker processes, which run inside a plain
+Python interpreter. So it must not import FreeCAD, or any other module of
+this package at the top level. The shape workers, i.e. checkShapes() and
+fuseShapes(), import FreeCAD and Part inside the function, which loads
+FreeCAD as a plain Python module in the worker through the search path
+inherited from FreeCAD. So only the workers running shape tasks pay for it.
+'''
+
+import os, sys, time, multiprocessing
+
+_context = None
+
+def _getPythonExecutable():
+    # When embedded in FreeCAD, sys.executable points to FreeCAD itself,
+    # which cannot be used to spawn a worker process.
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    ver = '{}.{}'.format(*sys.version_info[:2])
+    if sys.platform == 'win32':
+        candidates = [os.path.join(sys.exec_prefix,'python.exe'),
+                      os.path.join(sys.exec_prefix,'bin','python.exe')]
+    else:
+        candidates = [os.path.join(sys.exec_prefix,'bin','python'+ver),
+                      os.path.join(sys.exec_prefix,'bin','python3'),
+                      os.path.join(sys.exec_prefix,'bin','python')]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+
+def getContext():
+    '''
+    Return the multiprocessing context for spawning worker processes, or None
+    if not supported. Forking is never used, because it is not safe to fork
+    the GUI process.
+    '''
+    global _context
+    if _context is None:
+        _context = False
+        getter = getattr(multiprocessing,'get_context',None)
+        if getter:
+            executable = _getPythonExecutable()
+            if executable:
+                _context = getter('spawn')
+                _context.set_executable(executable)
+    return _context if _context else None
+
+def isSupported():
+    return getContext() is not None
+
+def getWorkerCount(count):
+    return max(1,min(count,multiprocessing.cpu_count()))
+
+_pool = None
+
+# default timeout in seconds of the tasks run in the worker pool
+DefaultTimeout = 60
+
+def getPool():
+    '''
+    Return a shared pool of worker processes. The pool is kept alive for
+    later use, so that the cost of spawning the workers and importing modules
+    in them is only paid once.
+    '''
+    global _pool
+    if _pool is None:
+        ctx = getContext()
+        if not ctx:
+            raise RuntimeError('parallel solving is not supported')
+        _pool = ctx.Pool(getWorkerCount(multiprocessing.cpu_count()))
+    return _pool
+
+def closePool():
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool = None
+
+def mapAll(func,argsList,timeout=DefaultTimeout):
+    '''
+    Run func(*args) for each 'args' in 'argsList' in the shared worker pool,
+    and return a list of results in the same order. An exception raised by
+    the worker is returned as the result, and unfinished ones are returned
+    as None, in which case the pool is closed, because the worker may be
+    stuck or dead.
+    '''
+    pool = getPool()
+    results = [pool.apply_async(func,args) for args in argsList]
+    ret = []
+    stamp = time.time()
+    for result in results:
+        try:
+            ret.append(result.get(max(0.01,timeout-(time.time()-stamp))))
+        except multiprocessing.TimeoutError:
+            ret.append(None)
+        except Exception as e:
+            ret.append(e)
+    if None in ret:
+        closePool()
+    return ret
+
+def runAll(func,argsList,timeout=DefaultTimeout):
+    '''
+    Run func(*args) for each 'args' in 'argsList' concurrently in the shared
+    worker pool, and return a list of results in the same order. Same as
+    mapAll().
+    '''
+    return mapAll(func,argsList,timeout)
+
+def race(func,argsList,accept=None,timeout=DefaultTimeout):
+    '''
+    Run func(*args) for each 'args' in 'argsList' concurrently in the shared
+    worker pool. Return a tuple(index,result) of the first result accepted by
+    accept(result), or None if there is none. The other tasks are left to
+    finish in the pool with their results discarded. If there is still some
+    unfinished task on timeout, the pool is closed, because the worker may be
+    stuck or dead.
+    '''
+    pool = getPool()
+    results = [pool.apply_async(func,args) for args in argsList]
+    pending = list(range(len(results)))
+    stamp = time.time()
+    while pending:
+        for i in list(pending):
+            if not results[i].ready():
+                continue
+            pending.remove(i)
+            try:
+                v = results[i].get()
+            except Exception:
+                continue
+            if accept is None or accept(v):
+                return i,v
+        if pending:
+            if time.time()-stamp > timeout:
+                closePool()
+                break
+            results[pending[0]].wait(0.01)
+
+_JacobianFree = set(('Nelder-Mead','Powell','COBYLA'))
+_HessianRequired = set(('Newton-CG','dogleg','trust-ncg'))
+_cache = [None,None]
+
+def minimize(expr,count,x0,method,tol=None,options=None):
+    '''
+    Minimize a serialized SymPy expression in a worker process
+
+    expr: the expression serialized by sympy.srepr(), with its variables
+    named as x0, x1, ...
+
+    count: the number of variables
+
+    x0: initial values of the variables
+
+    method, tol, options: passed to scipy.optimize.minimize()
+
+    Return a tuple(success,x,fun,message,method)
+    '''
+    import sympy as sp
+    import scipy.optimize as sopt
+    import numpy as np
+
+    symbols = [sp.Symbol('x{}'.format(i),real=True) for i in range(count)]
+    if _cache[0] != expr:
+        f = sp.sympify(expr)
+        _cache[0] = expr
+        _cache[1] = [f,sp.lambdify(symbols,f,modules='numpy'),None,None]
+    f,func,jfuncs,hfuncs = _cache[1]
+
+    jac = hess = None
+    if method not in _JacobianFree:
+        if jfuncs is None:
+            jfuncs = [sp.lambdify(symbols,f.diff(x),modules='numpy')
+                        for x in symbols]
+            _cache[1][2] = jfuncs
+        jac = lambda x: np.array([j(*x) for j in jfuncs])
+    if method in _HessianRequired:
+        if hfuncs is None:
+            hfuncs = [[sp.lambdify(symbols,f.diff(x,y),modules='numpy')
+                        for x in symbols] for y in symbols]
+            _cache[1][3] = hfuncs
+        hess = lambda x: np.array([[h(*x) for h in row] for row in hfuncs])
+
+    ret = sopt.minimize(lambda x: func(*x),x0,jac=jac,hess=hess,
+            tol=tol,method=method,options=options)
+    return (bool(ret.success), [float(v) for v in ret.x], float(ret.fun),
+            str(getattr(ret,'message','')), method)
+
+def checkShapes(breps,tasks,clearance,tolerance):
+    '''
+    Check shape interference in a worker process
+
+    breps: dict(index -> BREP string) of the shapes in their local coordinate
+    systems
+
+    tasks: list of tuple(step,i,j,placement1,placement2), where placements
+    are given as (x,y,z,qx,qy,qz,qw)
+
+    clearance: if greater than zero, check the minimum distance against it,
+    or else check the common volume against 'tolerance'
+
+    Return a list of tuple(step,i,j,value) of the interfering pairs
+    '''
+    import FreeCAD, Part
+
+    shapes = {}
+    for i,brep in breps.items():
+        shape = Part.Shape()
+        shape.importBrepFromString(brep)
+        shapes[i] = shape
+
+    def place(shape,v):
+        shape = shape.copy()
+        shape.Placement = FreeCAD.Placement(FreeCAD.Vector(*v[:3]),
+                FreeCAD.Rotation(*v[3:]))
+        return shape
+
+    ret = []
+    for step,i,j,pla1,pla2 in tasks:
+        shape1 = place(shapes[i],pla1)
+        shape2 = place(shapes[j],pla2)
+        if clearance > 0:
+            v = shape1.distToShape(shape2)[0]
+            if v < clearance:
+                ret.append((step,i,j,v))
+        else:
+            v = shape1.common(shape2).Volume
+            if v > tolerance:
+                ret.append((step,i,j,v))
+    return ret
+
+def fuseShapes(brep1,brep2):
+    '''
+    Fuse two shapes given as BREP strings in a worker process, and return the
+    result as BREP string
+    '''
+    import Part
+
+    shapes = []
+    for brep in (brep1,brep2):
+        shape = Part.Shape()
+        shape.importBrepFromString(brep)
+        shapes.append(shape)
+    return shapes[0].fuse(shapes[1]).exportBrepToString()
@@ -1,7 +1,8 @@
-import random, math
-from collections import namedtuple
+import os, random, math, time
+from collections import namedtuple, OrderedDict
 import FreeCAD, FreeCADGui
-from .assembly import Assembly, isTypeOf, setPlacement
+from .assembly import Assembly, isTypeOf, setPlacement, getElementInfo, \
+                      SolveModeFlexible, AsmWorkPlane, ElementInfo
 from . import utils
 from .utils import syslogger as logger, objName, isSamePlacement
 from .constraint import Constraint, cstrName, \
@@ -24,13 +25,26 @@ from .system import System
 PartInfo = namedtuple('SolverPartInfo', ('Part','PartName','Placement',
     'Params','Workplane','EntityMap','Group','CstrMap'))
 
+# Assembly: a flexible sub-assembly
+# Placement: the accumulated placement of the sub-assembly relative to the
+#            assembly being solved, before solving. The solved placement is
+#            defined by the parameters of the sub-assembly body, i.e. the
+#            PartInfo of the sub-assembly itself.
+# Prefix: prefix of the part names inside the sub-assembly
+# Constraints: the constraints of the sub-assembly
+SolverFrame = namedtuple('SolverFrame', ('Assembly','Placement','Prefix',
+    'Constraints'))
+
 class Solver(object):
-    def __init__(self,assembly,reportFailed,dragPart,recompute,rollback):
-        self.system = System.getSystem(assembly)
+    def __init__(self,assembly,reportFailed,dragPart,recompute,rollback,
+            system=None,driver=None,apply=True):
+        self.writeBack = None
+        self._driver = None
+        self.system = system if system else System.getSystem(assembly)
         cstrs = assembly.Proxy.getConstraints()
         if not cstrs:
-            logger.debug('skip assembly {} with no constraint'.format(
-                objName(assembly)))
+            logger.debug('skip assembly {} with no constraint',
+                objName(assembly))
             return
 
         self._fixedGroup = 2
@@ -38,6 +52,15 @@ class Solver(object):
         self._partMap = {}
         self._cstrMap = {}
         self._fixedElements = set()
+        self._bbox = FreeCAD.BoundBox()
+        # flexible sub-assembly -> SolverFrame
+        self._flexible = {}
+        # part of flexible sub-assembly -> SolverFrame
+        self._frames = {}
+        # the frame of the assembly whose constraints are being prepared
+        self._frame = None
+        # fixed part of flexible sub-assembly -> SolverFrame
+        self._frameFixed = {}
 
         self.system.GroupHandle = self._fixedGroup
 
@@ -57,21 +80,63 @@ class Solver(object):
         self.ny = self.system.addNormal3dV(*utils.getNormal(roty))
 
         parts = assembly.Proxy.getPartGroup().Group
+        subFrames = self.addFlexibleAssemblies(parts)
+
         self._fixedParts = Constraint.getFixedParts(self,cstrs,parts)
+        for frame in subFrames:
+            self._frame = frame
+            for part in Constraint.getFixedParts(self,frame.Constraints,
+                    frame.Assembly.Proxy.getPartGroup().Group):
+                if not isinstance(part,tuple) and \
+                   (utils.isDraftWire(part) or not hasattr(part,'Placement')):
+                    # no placement to attach, fix it as before
+                    self._fixedParts.add(part)
+                else:
+                    self._frameFixed[part] = frame
+        self._frame = None
         for part in self._fixedParts:
             self._fixedElements.add((part,None))
 
-        for cstr in cstrs:
-            self.system.log('preparing {}'.format(cstrName(cstr)))
+        # Add the bodies of the flexible sub-assemblies, parent first, so
+        # that the parent constraints can move them as a whole
+        for frame in subFrames:
+            self.addFrameBody(frame)
+
+        # The constraints of the flexible sub-assemblies are solved together
+        # with ours, with their parts transformed into our coordinate system
+        cstrs = list(cstrs)
+        frames = [None]*len(cstrs)
+        for frame in subFrames:
+            cstrs += frame.Constraints
+            frames += [frame]*len(frame.Constraints)
+
+        if driver in cstrs:
+            # Prepare the driving constraint last, so that it can be prepared
+            # again later with the state recorded just before it.
+            idx = cstrs.index(driver)
+            cstrs.append(cstrs.pop(idx))
+            frames.append(frames.pop(idx))
+
+        for cstr,frame in zip(cstrs,frames):
+            self._frame = frame
+            self.system.log('preparing {}',cstrName(cstr))
             self.system.GroupHandle += 1
+            if cstr == driver and getattr(self.system,'updateValues',None):
+                # Create the parts of the driving constraint beforehand, so
+                # that their parameters are not touched by updateDriver(),
+                # and keep the solved values
+                for e in cstr.Proxy.getElements():
+                    self.getPartInfo(self.getElementInfo(e))
+                self._driver = cstr
+                self._driverState = (self.system.GroupHandle, frame,
+                        self.saveDriverState())
             ret = Constraint.prepare(cstr,self)
-            if ret:
-                if isinstance(ret,(list,tuple)):
-                    for h in ret:
-                        if not isinstance(h,(list,tuple)):
-                            self._cstrMap[h] = cstr
-                else:
-                    self._cstrMap[ret] = cstr
+            logger.record('debug','prepare',assembly.Name,cstr.Name,
+                    len(ret) if isinstance(ret,(list,tuple)) else int(bool(ret)))
+            handles = self.mapConstraint(cstr,ret)
+            if cstr == driver:
+                self._driverHandles = handles
+        self._frame = None
 
         if dragPart:
             # TODO: this is ugly, need a better way to expose dragging interface
@@ -81,13 +146,18 @@ class Solver(object):
                 if info and info.Workplane:
                     # add dragging point
                     self.system.log('add drag point '
-                        '{}'.format(info.Workplane[1]))
+                        '{}',info.Workplane[1])
                     # TODO: slvs addWhereDragged doesn't work as expected, need
                     # to investigate more
                     # addDragPoint(info.Workplane[1],group=self.group)
 
-        self.system.log('solving {}'.format(objName(assembly)))
+        if hasattr(self.system,'lengthScale'):
+            self.system.lengthScale = self.getLengthScale()
+
+        self.system.log('solving {}',objName(assembly))
         try:
+            if getattr(assembly,'CheckRedundancy',False):
+                self.analyze(assembly)
             self.system.solve(group=self.group,reportFailed=reportFailed)
         except RuntimeError as e:
             if reportFailed and self.system.Failed:
@@ -108,12 +178,16 @@ class Solver(object):
                             continue
                         cstr = cstrs[c.group-self._fixedGroup]
                     msg += '\n{}, handle: {}'.format(cstrName(cstr),h)
+                    logger.record('error','failed constraint',assembly.Name,
+                            cstr.Name,h)
                 logger.error(msg)
             raise RuntimeError('Failed to solve {}: {}'.format(
                 objName(assembly),e.message))
         self.system.log('done solving')
 
-        touched = False
+        # Collect all the changes first, and then write them back in one
+        # batch, followed by a single recompute
+        writeBack = WriteBack()
         for part,partInfo in self._partMap.items():
             if part in self._fixedParts:
                 continue
@@ -130,39 +204,41 @@ class Solver(object):
                     v = partInfo.Placement.inverse().multVec(v)
                     idx = utils.draftWireVertex2PointIndex(part,key[:-2])
                     if utils.isSamePos(points[idx],v):
-                        self.system.log('not moving {} point {}'.format(
-                            partInfo.PartName,idx))
+                        self.system.log('not moving {} point {}',
+                            partInfo.PartName,idx)
                     else:
                         changed = True
-                        self.system.log('moving {} point{} from {}->{}'.format(
-                            partInfo.PartName,idx,points[idx],v))
+                        self.system.log('moving {} point{} from {}->{}',
+                            partInfo.PartName,idx,points[idx],v)
                         if rollback is not None:
                             rollback.append((partInfo.PartName,
                                              part,
                                              (idx, points[idx])))
                         points[idx] = v
                 if changed:
-                    touched = True
-                    part.Points = points
+                    writeBack.setProperties(part,('Points',points))
             else:
-                params = [self.system.getParam(h).val for h in partInfo.Params]
-                p = params[:3]
-                q = (params[4],params[5],params[6],params[3])
-                pla = FreeCAD.Placement(FreeCAD.Vector(*p),FreeCAD.Rotation(*q))
-                if isSamePlacement(partInfo.Placement,pla):
-                    self.system.log('not moving {}'.format(partInfo.PartName))
+                pla = self.getSolvedPlacement(partInfo)
+                oldPla = partInfo.Placement
+                frame = self.getFrame(part)
+                if frame:
+                    # transform back to the coordinate system of the
+                    # sub-assembly, which may have been moved as well
+                    pla = self.getSolvedPlacement(
+                            self._partMap[frame.Assembly]).inverse().multiply(pla)
+                    oldPla = frame.Placement.inverse().multiply(oldPla)
+                if isSamePlacement(oldPla,pla):
+                    self.system.log('not moving {}',partInfo.PartName)
                 else:
-                    touched = True
-                    self.system.log('moving {} {} {} {}'.format(
-                        partInfo.PartName,partInfo.Params,params,pla))
+                    self.system.log('moving {} {} {}',
+                        partInfo.PartName,partInfo.Params,pla)
                     if rollback is not None:
                         rollback.append((partInfo.PartName,
                                         part,
-                                        partInfo.Placement.copy()))
-                    setPlacement(part,pla)
+                                        oldPla.copy()))
+                    writeBack.setPlacement(part,pla)
 
                 if utils.isDraftCircle(part):
-                    changed = False
                     h = partInfo.EntityMap.get('Edge1.c',None)
                     if not h:
                         continue
@@ -181,21 +257,180 @@ class Solver(object):
                              math.degrees(p0.getAngle(p2)))
 
                     if utils.isSameValue(v0,v):
-                        self.system.log('not change draft circle {}'.format(
-                            partInfo.PartName))
+                        self.system.log('not change draft circle {}',
+                            partInfo.PartName)
                     else:
-                        touched = True
-                        self.system.log('change draft circle {} {}->{}'.format(
-                            partInfo.PartName,v0,v))
+                        self.system.log('change draft circle {} {}->{}',
+                            partInfo.PartName,v0,v)
                         if rollback is not None:
                             rollback.append((partInfo.PartName, part, v0))
-                        part.Radius = v[0]
-                        part.FirstAngle = v[1]
-                        part.LastAngle = v[2]
+                        writeBack.setProperties(part,('Radius',v[0]),
+                                ('FirstAngle',v[1]),('LastAngle',v[2]))
 
-        if recompute and touched:
+        self.writeBack = writeBack
+        if apply and writeBack.apply() and recompute:
             assembly.recompute(True)
 
+    def mapConstraint(self,cstr,ret):
+        'map the constraint handles returned by Constraint.prepare()'
+        handles = []
+        if ret:
+            if isinstance(ret,(list,tuple)):
+                for h in ret:
+                    if not isinstance(h,(list,tuple)):
+                        handles.append(h)
+            else:
+                handles.append(ret)
+        for h in handles:
+            self._cstrMap[h] = cstr
+        return handles
+
+    def saveDriverState(self):
+        '''
+        Save the state before preparing the driving constraint, i.e. the
+        system size, the parts, and the constraint and entity maps of each
+        part
+        '''
+        maps = dict([(part,(dict([(k,dict([(name,list(v))
+                            for name,v in cstrs.items()]))
+                        for k,cstrs in partInfo.CstrMap.items()]),
+                      dict(partInfo.EntityMap)))
+                    for part,partInfo in self._partMap.items()])
+        return self.system.getMark(),maps
+
+    def restoreDriverState(self,state,truncate=True):
+        mark,maps = state
+        if truncate:
+            self.system.truncate(mark)
+        for part in list(self._partMap):
+            if part not in maps:
+                # part added by the driving constraint
+                del self._partMap[part]
+                continue
+            partInfo = self._partMap[part]
+            cstrMap,entityMap = maps[part]
+            partInfo.CstrMap.clear()
+            partInfo.CstrMap.update(cstrMap)
+            partInfo.EntityMap.clear()
+            partInfo.EntityMap.update(entityMap)
+
+    def prepareDriver(self,groupHandle,frame):
+        self.system.GroupHandle = groupHandle
+        self._frame = frame
+        try:
+            ret = Constraint.prepare(self._driver,self)
+        finally:
+            self._frame = None
+        handles = self.mapConstraint(self._driver,ret)
+        if not handles:
+            raise RuntimeError('driving constraint {} has no effect'.format(
+                cstrName(self._driver)))
+        return handles
+
+    def updateDriver(self):
+        '''
+        Update the driving constraint with its current property values, and
+        solve the system starting from the last result
+        '''
+        if not self._driver:
+            raise RuntimeError('no driving constraint, or solver backend '
+                    'does not support updating the system')
+        groupHandle,frame,state = self._driverState
+
+        # Prepare the driving constraint again at the end of the system, as
+        # if it were prepared right after the saved state, and then let the
+        # system copy the new values into the existing items. So the system is
+        # kept as it is, and the SymPy backend reuses the equations.
+        current = self.saveDriverState()
+        partMap = dict(self._partMap)
+        self.restoreDriverState(state,False)
+        handles = self.prepareDriver(groupHandle,frame)
+        if self.system.updateValues(state[0],current[0],self.group):
+            for h in handles:
+                self._cstrMap.pop(h,None)
+            self._partMap = partMap
+            self.restoreDriverState(current,False)
+        else:
+            # The structure is changed, e.g. a different solution type is
+            # chosen. Remove everything the driving constraint created, and
+            # prepare it again.
+            self.system.log('rebuild driving constraint {}',
+                    cstrName(self._driver))
+            for h in self._driverHandles+handles:
+                self._cstrMap.pop(h,None)
+            self.restoreDriverState(state)
+            self._driverHandles = self.prepareDriver(groupHandle,frame)
+        self.system.solve(group=self.group)
+
+    def getSolvedPlacement(self,partInfo):
+        'return the solved placement of a part in our coordinate system'
+        v = [self.system.getParam(h).val for h in partInfo.Params]
+        return FreeCAD.Placement(FreeCAD.Vector(*v[:3]),
+                FreeCAD.Rotation(v[4],v[5],v[6],v[3]))
+
+    def getPlacements(self):
+        '''
+        Return a dict(partName -> tuple(x,y,z,qx,qy,qz,qw)) of the current
+        placements of all parts in the solving system
+        '''
+        ret = {}
+        for partInfo in self._partMap.values():
+            if not partInfo.Params:
+                continue
+            v = [self.system.getParam(h).val for h in partInfo.Params]
+            ret[partInfo.PartName] = (v[0],v[1],v[2],v[4],v[5],v[6],v[3])
+        return ret
+
+    def getResults(self):
+        '''
+        Return the solver results as a list of tuple(partName,placement) and
+        a list of tuple(partName,propertyValues), for caching
+        '''
+        if not self.writeBack:
+            return [],[]
+        names = {}
+        for part,partInfo in self._partMap.items():
+            names[part] = partInfo.PartName
+        placements = [(names[part],pla.copy())
+                for part,pla in self.writeBack.placements]
+        props = [(names[part],values) for part,values in self.writeBack.props]
+        return placements,props
+
+    def analyze(self,assembly):
+        analyze = getattr(self.system,'analyze',None)
+        if not analyze:
+            # A solver type with fallback, i.e. Auto, may well pick a backend
+            # without analysis
+            if getattr(System.getProxy(assembly),'getFallbackSystem',None):
+                log = logger.debug
+            else:
+                log = logger.warn
+            log('solver "{}" does not support redundancy check'.format(
+                System.getTypeName(assembly)))
+            return
+        groups = {}
+        for partInfo in self._partMap.values():
+            if partInfo.Params:
+                groups[partInfo.PartName] = partInfo.Params
+        stamp = time.time()
+        ret = analyze(self.group,groups)
+        logger.record('info','analyze',assembly.Name,'',
+                ret.Dof,len(ret.Redundant),time.time()-stamp)
+        logger.debug('{} analyzed in {:.3f}s, dof {}',
+            objName(assembly),time.time()-stamp,ret.Dof)
+        for name,dof in sorted(ret.GroupDof.items()):
+            if dof:
+                logger.info('{} under constrained part {}, dof {}'.format(
+                    objName(assembly),name,dof))
+        singular = getattr(ret,'Singular',None)
+        if singular:
+            logger.warn('{} has {} constraint(s) with vanishing gradient at '
+                'the current placement, skipped in redundancy check',
+                objName(assembly),len(singular))
+        if ret.Redundant:
+            self.system.Failed = ret.Redundant
+            raise RuntimeError('redundant constraints')
+
     def isFixedPart(self,part):
         return part in self._fixedParts
 
@@ -206,7 +441,145 @@ class Solver(object):
     def addFixedElement(self,part,subname):
         self._fixedElements.add((part,subname))
 
+    @staticmethod
+    def getFlexibleAssemblies(assembly,recursive=False):
+        '''
+        Return the child assemblies with 'Flexible' solve mode. Links to
+        assemblies are always treated as rigid, because their parts may be
+        shared by multiple instances.
+        '''
+        partGroup = assembly.Proxy.getPartGroup()
+        ret = [part for part in partGroup.Group if isTypeOf(part,Assembly)
+                    and getattr(part,'SolveMode','')==SolveModeFlexible]
+        if recursive:
+            for child in list(ret):
+                ret += Solver.getFlexibleAssemblies(child,True)
+        return ret
+
+    def addFlexibleAssemblies(self,parts,parent=None):
+        ret = []
+        for part in parts:
+            if not isTypeOf(part,Assembly) or \
+               getattr(part,'SolveMode','')!=SolveModeFlexible:
+                continue
+            if parent:
+                pla = parent.Placement.multiply(part.Placement)
+                prefix = parent.Prefix + part.Name + '.'
+            else:
+                pla = part.Placement
+                prefix = part.Name + '.'
+            frame = SolverFrame(Assembly = part,
+                                Placement = pla,
+                                Prefix = prefix,
+                                Constraints = part.Proxy.getConstraints() or [])
+            self._flexible[part] = frame
+            children = part.Proxy.getPartGroup().Group
+            for child in children:
+                self._frames[child] = frame
+            self.system.log('flexible sub-assembly {}',prefix)
+            ret.append(frame)
+            ret += self.addFlexibleAssemblies(children,frame)
+        return ret
+
+    def addFrameBody(self,frame):
+        '''
+        Add the body of a flexible sub-assembly, i.e. the seven placement
+        parameters of the sub-assembly itself. The fixed parts of the
+        sub-assembly are attached to it, see attachToFrame()
+        '''
+        info = ElementInfo(Parent=None,
+                           SubnameRef='',
+                           Part=frame.Assembly,
+                           PartName=frame.Prefix[:-1],
+                           Placement=frame.Placement,
+                           Object=frame.Assembly,
+                           Subname='',
+                           Shape=None)
+        return self.getPartInfo(info)
+
+    def attachToFrame(self,partInfo,frame):
+        '''
+        Constrain a fixed part of a flexible sub-assembly to keep its placement
+        relative to the body of the sub-assembly, instead of fixing it in our
+        coordinate system
+        '''
+        body = self._partMap[frame.Assembly]
+        pla = frame.Placement.inverse().multiply(partInfo.Placement)
+        system = self.system
+        nameTag = partInfo.PartName + '.f'
+
+        system.NameTag = nameTag + 'p'
+        p = system.addPoint3dV(*pla.Base)
+        system.NameTag = nameTag + 'pt'
+        p = system.addTransform(p,*body.Params,group=body.Group)
+        system.NameTag = nameTag + 'n'
+        n = system.addNormal3dV(*utils.getNormal(pla.Rotation))
+        system.NameTag = nameTag + 'nt'
+        n = system.addTransform(n,*body.Params,group=body.Group)
+
+        system.NameTag = nameTag + 'c'
+        e1 = system.addPointsCoincident(p,partInfo.Workplane.origin.entity,
+                group=self.group)
+        system.NameTag = nameTag + 'o'
+        e2 = system.addSameOrientation(n,partInfo.Workplane.normal.entity,
+                group=self.group)
+        system.log('{}: attach to {} {},{}',partInfo.PartName,
+                body.PartName,e1,e2)
+
+    def getFrameBody(self):
+        '''
+        Return the body of the flexible sub-assembly whose constraints are
+        being prepared, or None
+        '''
+        if self._frame:
+            return self._partMap.get(self._frame.Assembly,None)
+
+    def getElementInfo(self,element):
+        return self.resolveInfo(element.Proxy.getInfo())
+
+    def resolveInfo(self,info,frame=False):
+        '''
+        Resolve the element information for solving. Elements referring into
+        flexible sub-assemblies are resolved to the part of the
+        sub-assembly, and the placement is transformed into the coordinate
+        system of the assembly being solved.
+
+        info: the element information, relative to 'frame'
+
+        frame: the SolverFrame, or None for the assembly being solved. If
+        not given, use the frame of the constraint being prepared.
+        '''
+        if frame is False:
+            frame = self._frame
+        while not isinstance(info.Part,tuple) and info.Part in self._flexible:
+            frame = self._flexible[info.Part]
+            info = getElementInfo(info.Part,info.Subname)
+        if not frame:
+            return info
+        return info._replace(PartName = frame.Prefix + info.PartName,
+                Placement = frame.Placement.multiply(info.Placement))
+
+    def getFrame(self,part):
+        if isinstance(part,tuple):
+            part = part[0]
+        return self._frames.get(part,None)
+
+    def getLengthScale(self):
+        '''
+        Return the characteristic length of the assembly, i.e. the diagonal
+        length of the bounding box of all the constrained elements
+        '''
+        if not self._bbox.isValid():
+            return 1.0
+        return max(self._bbox.DiagonalLength,1.0)
+
     def getPartInfo(self,info,fixed=False,group=0):
+        if info.Shape:
+            bbox = info.Shape.BoundBox
+            if bbox.isValid():
+                self._bbox.add(info.Placement.multVec(bbox.getPoint(0)))
+                self._bbox.add(info.Placement.multVec(bbox.getPoint(6)))
+
         partInfo = self._partMap.get(info.Part,None)
         if partInfo:
             return partInfo
@@ -252,11 +625,247 @@ class Solver(object):
                             Group = group if group else g,
                             CstrMap = {})
 
-        self.system.log('{}, {}'.format(partInfo,g))
+        self.system.log('{}, {}',partInfo,g)
 
         self._partMap[info.Part] = partInfo
+
+        frame = self._frameFixed.get(info.Part,None)
+        if frame and params:
+            self.attachToFrame(partInfo,frame)
         return partInfo
 
+class WriteBack(object):
+    '''
+    Batched write back of the solver results
+
+    The changes are collected first, and then applied in one go by apply().
+    Changes of the collapsed link array elements are merged into a single
+    PlacementList assignment per array.
+    '''
+    def __init__(self):
+        self.placements = []
+        self.props = []
+
+    def setPlacement(self,part,pla):
+        self.placements.append((part,pla))
+
+    def setProperties(self,part,*values):
+        self.props.append((part,values))
+
+    def apply(self):
+        'apply all changes, return False if there is no change'
+        if not self.placements and not self.props:
+            return False
+        arrays = {}
+        for part,pla in self.placements:
+            if isinstance(part,tuple) and isinstance(part[1],int):
+                arrays.setdefault(part[0],{})[part[1]] = pla
+            else:
+                setPlacement(part,pla)
+        for array,plas in arrays.items():
+            array.PlacementList = plas
+        for part,values in self.props:
+            for name,v in values:
+                setattr(part,name,v)
+        return True
+
+    @staticmethod
+    def rollback(rollback):
+        '''
+        Roll back the changes recorded by the solver
+
+        rollback: a list of tuple(name,part,value), where 'value' is either
+        a placement, a tuple(index,point) of a draft wire point, or a
+        tuple(radius,firstAngle,lastAngle) of a draft circle. Earlier records
+        take precedence.
+        '''
+        writeBack = WriteBack()
+        points = {}
+        for name,part,v in reversed(rollback):
+            logger.debug('roll back {} to {}',name,v)
+            if isinstance(v,FreeCAD.Placement):
+                writeBack.setPlacement(part,v)
+            elif utils.isDraftWire(part):
+                idx,pt = v
+                pts = points.get(part,None)
+                if pts is None:
+                    pts = part.Points
+                    points[part] = pts
+                    writeBack.setProperties(part,('Points',pts))
+                pts[idx] = pt
+            elif utils.isDraftCircle(part):
+                r,a1,a2 = v
+                writeBack.setProperties(part,('Radius',r),
+                        ('FirstAngle',a1),('LastAngle',a2))
+        writeBack.apply()
+
+class SolverCache(object):
+    '''
+    Bounded LRU cache of solver results keyed by assembly state fingerprint
+
+    The fingerprint does not contain any object names, so that copies of the
+    same sub-assembly in identical internal state share the same cache entry,
+    and only one of them is actually solved. The results are stored with
+    part indices instead of part objects, and are resolved again using the
+    part map obtained by getFingerprint()
+    '''
+    def __init__(self,size=64):
+        self.size = size
+        self.cache = OrderedDict()
+
+    def clear(self):
+        self.cache.clear()
+
+    def get(self,key):
+        ret = self.cache.pop(key,None)
+        if ret is not None:
+            self.cache[key] = ret
+        return ret
+
+    def set(self,key,value):
+        self.cache.pop(key,None)
+        self.cache[key] = value
+        while len(self.cache) > self.size:
+            self.cache.popitem(False)
+
+    @staticmethod
+    def _placementKey(pla):
+        return tuple(pla.Base) + tuple(pla.Rotation.Q)
+
+    @staticmethod
+    def _valueKey(v):
+        # Use exact values, because the string representation of Quantity
+        # and others are rounded
+        if isinstance(v,(bool,int,float,str)):
+            return v
+        value = getattr(v,'Value',None)
+        if isinstance(value,(int,float)):
+            return float(value)
+        if isinstance(v,FreeCAD.Placement):
+            return SolverCache._placementKey(v)
+        if isinstance(v,FreeCAD.Vector):
+            return tuple(v)
+        if isinstance(v,(list,tuple)):
+            return tuple([SolverCache._valueKey(e) for e in v])
+        return repr(v)
+
+    # attributes of the curve or surface that define the solver entities
+    _GeometryAttrs = ('Center','Axis','Position','Location','Direction',
+            'Radius','MajorRadius','MinorRadius','Apex','SemiAngle')
+
+    @staticmethod
+    def _geometryKey(geo):
+        key = [geo.__class__.__name__]
+        for name in SolverCache._GeometryAttrs:
+            try:
+                v = getattr(geo,name,None)
+            except Exception:
+                continue
+            if v is not None:
+                key.append((name,SolverCache._valueKey(v)))
+        return tuple(key)
+
+    @staticmethod
+    def _shapeKey(shape):
+        '''
+        Return the exact geometry of an element shape, i.e. its placement,
+        vertex positions, and the definition of its curve or surface
+        '''
+        shapeType = shape.ShapeType
+        key = [shapeType,SolverCache._placementKey(shape.Placement)]
+        key += [tuple(v.Point) for v in shape.Vertexes]
+        if shapeType == 'Edge':
+            key += [shape.FirstParameter,shape.LastParameter,
+                    SolverCache._geometryKey(shape.Curve)]
+        elif shapeType == 'Face':
+            key += [shape.Area,SolverCache._geometryKey(shape.Surface)]
+        return tuple(key)
+
+    @staticmethod
+    def getFingerprint(assembly,cstrs):
+        '''
+        Return a tuple(fingerprint,parts), where 'fingerprint' covers the
+        solver type and settings, the constraint types and property values,
+        the element references, the placements of the involved parts, and
+        the inputs of Constraint.getFixedParts(), i.e. the part group order,
+        parts without placement, and fixed workplanes. 'parts' is a
+        dict(partName -> tuple(index,part)) of the involved parts, indexed by
+        the order of their first reference.
+        '''
+        parts = {}
+        valueKey = SolverCache._valueKey
+        key = [System.getTypeName(assembly)]
+        for prop in assembly.PropertiesList:
+            if assembly.getGroupOfProperty(prop).startswith('Solver'):
+                key.append((prop,valueKey(getattr(assembly,prop))))
+        for cstr in cstrs:
+            key.append(Constraint.getTypeName(cstr))
+            for prop in cstr.PropertiesList:
+                if cstr.getGroupOfProperty(prop) == 'Constraint':
+                    key.append((prop,valueKey(getattr(cstr,prop))))
+            for element in cstr.Proxy.getElements():
+                info = element.Proxy.getInfo()
+                idx = parts.get(info.PartName,None)
+                if idx is None:
+                    idx = (len(parts),info.Part)
+                    parts[info.PartName] = idx
+                key.append((idx[0], info.Subname,
+                    SolverCache._placementKey(info.Placement),
+                    SolverCache._shapeKey(info.Shape)))
+
+        indices = {}
+        for idx,part in sorted(parts.values(),key=lambda x:x[0]):
+            if isinstance(part,tuple):
+                # element of a link array
+                part = part[0]
+            indices.setdefault(part,idx)
+        for obj in assembly.Proxy.getPartGroup().Group:
+            key.append((indices.get(obj,-1), hasattr(obj,'Placement'),
+                isTypeOf(obj,AsmWorkPlane) and getattr(obj,'Fixed',False)))
+        return tuple(key),parts
+
+    def add(self,key,assembly,result,parts):
+        '''
+        Store the solver result obtained from Solver.getResults(). Nothing is
+        stored if the result involves any part not covered by the key.
+        '''
+        indexed = []
+        for items in result:
+            converted = []
+            for name,value in items:
+                idx = parts.get(name,None)
+                if idx is None:
+                    return
+                converted.append((idx[0],value))
+            indexed.append(converted)
+        self.set(key,(objName(assembly),indexed[0],indexed[1]))
+
+    def apply(self,assembly,result,parts,recompute):
+        '''
+        Apply the cached result, return False if any part cannot be resolved
+        '''
+        source,placements,props = result
+        if source != objName(assembly):
+            logger.debug('reuse result of identical assembly {} for {}',
+                    source,objName(assembly))
+        indices = dict(parts.values())
+        writeBack = WriteBack()
+        for idx,pla in placements:
+            part = indices.get(idx,None)
+            if part is None:
+                return False
+            writeBack.setPlacement(part,pla)
+        for idx,values in props:
+            part = indices.get(idx,None)
+            if part is None:
+                return False
+            writeBack.setProperties(part,*values)
+        if writeBack.apply() and recompute:
+            assembly.recompute(True)
+        return True
+
+_ResultCache = SolverCache()
+
 def _solve(objs=None,recursive=None,reportFailed=True,
         recompute=True,dragPart=None,rollback=None):
     if not objs:
@@ -277,9 +886,9 @@ def _solve(objs=None,recursive=None,reportFailed=True,
         if not isTypeOf(obj,Assembly):
             continue
         if System.isDisabled(obj):
-            logger.debug('bypass disabled assembly {}'.format(objName(obj)))
+            logger.debug('bypass disabled assembly {}',objName(obj))
             continue
-        logger.debug('adding assembly {}'.format(objName(obj)))
+        logger.debug('adding assembly {}',objName(obj))
         assemblies.append(obj)
 
     if not assemblies:
@@ -299,45 +908,176 @@ def _solve(objs=None,recursive=None,reportFailed=True,
             if not isTypeOf(obj,Assembly):
                 continue
             if System.isDisabled(obj):
-                logger.debug('skip disabled assembly {}'.format(objName(obj)))
+                logger.debug('skip disabled assembly {}',objName(obj))
                 continue
-            logger.debug('adding assembly {}'.format(objName(obj)))
+            logger.debug('adding assembly {}',objName(obj))
             assemblies.append(obj)
 
         if not assemblies:
             raise RuntimeError('no assembly need to be solved')
 
+    # Flexible sub-assemblies are solved together with their parent, so
+    # defer them to the parent if it is going to be solved
+    flexible = {}
+    for assembly in assemblies:
+        for child in Solver.getFlexibleAssemblies(assembly):
+            flexible[child] = assembly
+
+    assembly = None
     try:
         for assembly in assemblies:
             if recompute:
                 assembly.recompute(True)
+            parent = flexible.get(assembly,None)
+            if parent:
+                if System.isTouched(assembly):
+                    logger.debug('defer flexible assembly {} to {}',
+                            objName(assembly),objName(parent))
+                    System.touch(parent)
+                continue
             if not System.isTouched(assembly):
                 logger.debug('skip untouched assembly '
-                    '{}'.format(objName(assembly)))
+                    '{}',objName(assembly))
                 continue
-            Solver(assembly,reportFailed,dragPart,recompute,rollback)
+            children = Solver.getFlexibleAssemblies(assembly,True)
+            key = None
+            if dragPart is None and rollback is None and not children:
+                cstrs = assembly.Proxy.getConstraints()
+                if cstrs:
+                    key,parts = SolverCache.getFingerprint(assembly,cstrs)
+                    result = _ResultCache.get(key)
+                    if result and _ResultCache.apply(
+                            assembly,result,parts,recompute):
+                        logger.debug('reuse cached result of {}',
+                                objName(assembly))
+                        logger.record('info','cached',assembly.Name)
+                        System.touch(assembly,False)
+                        continue
+            logger.record('info','solve',assembly.Name,'',
+                    System.getTypeName(assembly))
+            stamp = time.time()
+            system = System.getSystem(assembly)
+            while True:
+                # only the time of the succeeding backend is recorded
+                systemStamp = time.time()
+                try:
+                    solver = Solver(assembly,reportFailed,dragPart,
+                            recompute,rollback,system)
+                    break
+                except Exception as e:
+                    system = System.getSystem(assembly,True)
+                    if not system:
+                        raise
+                    logger.warn('{}, try the next solver backend',e)
+            System.recordSolveCost(assembly,time.time()-systemStamp)
+            cost = time.time()-stamp
+            if key is not None:
+                _ResultCache.add(key,assembly,solver.getResults(),parts)
+            logger.record('info','solved',assembly.Name,'',cost)
+            assembly.Proxy.recordSolveCost(cost)
             System.touch(assembly,False)
-    except Exception:
+            for child in children:
+                System.touch(child,False)
+    except Exception as e:
+        logger.record('error','solve failed',
+                assembly.Name if assembly else '','',str(e))
         if rollback is not None:
-            for name,part,v in reversed(rollback):
-                logger.debug('roll back {} to {}'.format(name,v))
-                if isinstance(v,FreeCAD.Placement):
-                    setPlacement(part,v)
-                elif utils.isDraftWire(part):
-                    idx,pt = v
-                    part.Points[idx] = pt
-                elif utils.isDraftWire(part):
-                    r,a1,a2 = v
-                    part.Radius = r
-                    part.FirstAngle = a1
-                    part.LastAngle = a2
-
+            WriteBack.rollback(rollback)
+        if reportFailed:
+            logger.catch('failed to dump solver events',dumpEvents,True)
         raise
 
     return True
 
+def dumpEvents(toFile=False):
+    '''
+    Dump the recorded solver events to the console, or to a log file inside
+    FreeCAD user data directory if 'toFile' is True
+    '''
+    path = None
+    if toFile:
+        path = os.path.join(FreeCAD.getUserAppDataDir(),_EventLogName)
+    count = logger.dumpEvents(path,maxSize=_EventLogMaxSize)
+    if path and count:
+        logger.warn('{} solver events dumped to {}',count,path)
+
+_EventLogName = 'asm3_solver_events.log'
+# The event log is rotated once exceeding this size, so that the failed auto
+# solving on every edit does not grow it without limit
+_EventLogMaxSize = 1<<20
+
 _SolverBusy = False
 
+def sweep(assembly,cstr,prop,values,reportFailed=False):
+    '''
+    Solve the assembly for a sequence of values of a driving constraint
+    property, e.g. to simulate a mechanism
+
+    assembly: the assembly object
+
+    cstr: the driving constraint object of the assembly
+
+    prop: the name of the driving property, e.g. 'Angle' or 'Offset'
+
+    values: a sequence of the property values
+
+    If the solver backend supports updating the system in place (the
+    SolveSpace backend with a recent py_slvs, and the SymPy backend), the
+    system is built only once. At each step, only the values of the items
+    created by the driving constraint are changed, and the solving starts
+    from the result of the previous step. The SymPy backend keeps the changed
+    values as symbols, so the equations are generated and lambdified only
+    once. Otherwise, the system is rebuilt for each step.
+
+    Return a tuple(names,trajectory), where 'names' is a list of the part
+    names, and 'trajectory' is a NumPy array of shape (len(values),
+    len(names),7), with the placement of each part at each step stored as
+    (x,y,z,qx,qy,qz,qw). The document is not modified.
+    '''
+    global _SolverBusy
+    import numpy as np
+
+    if _SolverBusy:
+        raise RuntimeError("Recursive call of sweep() is not allowed")
+    values = list(values)
+    if not values:
+        raise ValueError('no sweep value')
+    if cstr not in (assembly.Proxy.getConstraints() or []):
+        raise RuntimeError('{} is not an active constraint of {}'.format(
+            cstrName(cstr),objName(assembly)))
+    if not hasattr(cstr,prop):
+        raise AttributeError('{} has no property {}'.format(
+            cstrName(cstr),prop))
+
+    oldValue = getattr(cstr,prop)
+    names = None
+    trajectory = None
+    try:
+        Assembly.cancelAutoSolve()
+        _SolverBusy = True
+        stamp = time.time()
+        solver = None
+        for i,value in enumerate(values):
+            setattr(cstr,prop,value)
+            if solver and solver._driver:
+                solver.updateDriver()
+            else:
+                solver = Solver(assembly,reportFailed,None,False,None,
+                        driver=cstr,apply=False)
+            placements = solver.getPlacements()
+            if names is None:
+                names = sorted(placements.keys())
+                trajectory = np.zeros((len(values),len(names),7))
+            for j,name in enumerate(names):
+                trajectory[i,j,:] = placements[name]
+        logger.record('info','sweep',assembly.Name,cstr.Name,
+                len(values),time.time()-stamp)
+    finally:
+        setattr(cstr,prop,oldValue)
+        _SolverBusy = False
+        Assembly.cancelAutoSolve()
+    return names,trajectory
+
 def solve(*args, **kargs):
     global _SolverBusy
     if _SolverBusy:
@@ -0,0 +1,161 @@
+import math
+from .system import System, SystemBase
+from .constraint import Constraint
+from .utils import syslogger as logger, objName, isDraftWire
+
+class SystemAuto(SystemBase):
+    '''
+    Automatic selection of the solver backend
+
+    The backends that support all the constraints of the assembly are ranked
+    by their estimated solving cost. If the solving fails, the solver falls
+    back to the next backend in the ranking.
+    '''
+    __metaclass__ = System
+    _id = 3
+    _props = SystemBase._props + ['CheckRedundancy']
+
+    # Cost model of each backend, i.e. seconds = scale * size ^ exponent,
+    # where 'size' is the estimated number of solver parameters. The initial
+    # values are rough figures obtained from solving the same assemblies
+    # with each backend. SolveSpace is much faster for small assemblies, but
+    # its dense Newton steps grow faster with the size than the quasi-Newton
+    # iterations of SciPy, whose cost is dominated by the equation generation
+    # of nearly linear cost. So the two cross over at about ten thousand
+    # parameters, i.e. over a thousand parts. The model is refined by the actual solving time at run
+    # time. See recordSolveCost().
+    _CostModel = {
+        'SolveSpace' : [2e-7, 2.6],
+        'SymPy + SciPy' : [5e-3, 1.5],
+    }
+    _CostAlpha = 0.3
+    # range of the fitted exponent
+    _CostExponent = (1.0,3.0)
+    # maximum number of samples kept for fitting the exponent
+    _CostSamples = 16
+
+    def __init__(self,obj):
+        super(SystemAuto,self).__init__(obj)
+        # the cost model is refined per instance, i.e. per assembly
+        self._costModel = dict([(name,list(model))
+                    for name,model in self._CostModel.items()])
+        # backend name -> list of tuple(log(size),log(cost))
+        self._costSamples = {}
+        self._backends = []
+        self._ranked = []
+        self._current = None
+        self._names = set()
+        self._size = 0
+        for tp in System.getInfo().Types:
+            if tp._id<=0 or tp is SystemAuto or tp._idx<0:
+                continue
+            # do not let the backend add its properties to the assembly
+            backend = tp(obj,False)
+            if not backend.isDisabled(obj):
+                self._backends.append(backend)
+
+    @classmethod
+    def getName(cls):
+        return 'Auto'
+
+    def isDisabled(self,_obj):
+        return not self._backends
+
+    def onDetach(self,obj):
+        for backend in self._backends:
+            callback = getattr(backend,'onDetach',None)
+            if callback:
+                callback(obj)
+
+    def onChanged(self,obj,prop):
+        for backend in self._backends:
+            backend.onChanged(obj,prop)
+        super(SystemAuto,self).onChanged(obj,prop)
+
+    def isConstraintSupported(self,cstrName):
+        for backend in self._backends:
+            if backend.isConstraintSupported(cstrName):
+                return True
+        return False
+
+    @staticmethod
+    def getProblemSize(obj):
+        'estimate the number of solver parameters'
+        size = 0
+        partGroup = obj.Proxy.getPartGroup()
+        for part in partGroup.Group if partGroup else []:
+            if isDraftWire(part):
+                size += 3*len(part.Points)
+            else:
+                size += 7
+        return max(size,1)
+
+    def estimateCost(self,backend,size):
+        scale,exponent = self._costModel.get(backend.getName(),(1.0,2.0))
+        return scale*size**exponent
+
+    def rank(self,obj):
+        cstrs = obj.Proxy.getConstraints() or []
+        self._names = set([Constraint.getSolverTypeName(c) for c in cstrs])
+        self._size = self.getProblemSize(obj)
+        ranked = [(self.estimateCost(backend,self._size),backend)
+                    for backend in self._backends]
+        ranked.sort(key=lambda x:x[0])
+        self._ranked = [backend for _,backend in ranked]
+        self._current = None
+        logger.debug('{} solver ranking, size {}: {}',objName(obj),self._size,
+                ['{}:{:.4f}'.format(backend.getName(),cost)
+                    for cost,backend in ranked])
+
+    def getSystem(self,obj):
+        self.rank(obj)
+        return self.getFallbackSystem(obj)
+
+    def getFallbackSystem(self,obj):
+        '''
+        Return the system of the backend that comes after the previously
+        returned one in the ranking, skipping those not supporting all the
+        constraints. The backend support is checked here instead of in
+        rank(), so that slow loading backends are only imported when needed.
+        '''
+        try:
+            idx = self._ranked.index(self._current)+1
+        except ValueError:
+            idx = 0
+        for backend in self._ranked[idx:]:
+            self._current = backend
+            if not all([backend.isConstraintSupported(name)
+                            for name in self._names]):
+                continue
+            logger.record('info','auto solver',obj.Name,'',
+                    backend.getName(),self._size)
+            return backend.getSystem(obj)
+
+    def recordSolveCost(self,_obj,cost):
+        '''
+        Refine the cost model of the backend that has just solved the
+        assembly. If the recorded sizes vary enough, both the scale and the
+        exponent are fitted by least squares in log space, or else only the
+        scale is refined.
+        '''
+        backend = self._current
+        if not backend or cost<=0:
+            return
+        name = backend.getName()
+        model = self._costModel.setdefault(name,[1.0,2.0])
+        samples = self._costSamples.setdefault(name,[])
+        samples.append((math.log(self._size),math.log(cost)))
+        del samples[:-self._CostSamples]
+
+        n = len(samples)
+        mx = sum([x for x,_ in samples])/n
+        my = sum([y for _,y in samples])/n
+        sxx = sum([(x-mx)**2 for x,_ in samples])
+        if sxx > n*math.log(2)**2:
+            sxy = sum([(x-mx)*(y-my) for x,y in samples])
+            lower,upper = self._CostExponent
+            model[1] = min(upper,max(lower,sxy/sxx))
+            model[0] = math.exp(my-model[1]*mx)
+        else:
+            scale = cost/self._size**model[1]
+            model[0] += self._CostAlpha*(scale-model[0])
@@ -11,8 +11,8 @@ class SystemSlvs(SystemBase):
     __metaclass__ = System
     _id = 1
 
-    def __init__(self,obj):
-        super(SystemSlvs,self).__init__(obj)
+    def __init__(self,obj,attach=True):
+        super(SystemSlvs,self).__init__(obj,attach)
 
     @classmethod
     def getName(cls):
@@ -32,6 +32,7 @@ class _SystemSlvs(SystemExtension,slvs.System):
 
     def solve(self, group=0, reportFailed=False):
         ret = super(_SystemSlvs,self).solve(group,reportFailed)
+        logger.record('debug','slvs solve','','',ret,self.Dof)
         if ret:
             reason = None
             if ret==1:
@@ -51,5 +52,59 @@ class _SystemSlvs(SystemExtension,slvs.System):
                 reason = 'unknown failure'
             if reason:
                 raise RuntimeError(reason)
-        self.log('dof remaining: {}'.format(self.Dof))
+        self.log('dof remaining: {}',self.Dof)
+
+    # Older py_slvs does not expose the handle counters
+    if hasattr(slvs.System,'ParamHandle'):
+        def getMark(self):
+            'Return a mark of the current system size for truncate()'
+            return (self.ParamHandle,self.EntityHandle,self.ConstraintHandle)
+
+        def truncate(self,mark):
+            '''
+            Remove all parameters, entities and constraints added after the
+            mark returned by getMark()
+            '''
+            params,entities,cstrs = mark
+            # handles are allocated in sequence
+            for h in range(self.ConstraintHandle,cstrs,-1):
+                self.removeConstraint(h)
+            for h in range(self.EntityHandle,entities,-1):
+                self.removeEntity(h)
+            for h in range(self.ParamHandle,params,-1):
+                self.removeParam(h)
+            self.ParamHandle = params
+            self.EntityHandle = entities
+            self.ConstraintHandle = cstrs
+
+        def updateValues(self,mark0,mark1,group):
+            '''
+            Copy the values of the items added after 'mark1' to the
+            corresponding items added between 'mark0' and 'mark1', and then
+            remove the former. Parameters of the solving 'group' are not
+            copied. Return False without any change if the two sets of items
+            are not of the same structure.
+            '''
+            mark2 = self.getMark()
+            count = [b-a for a,b in zip(mark0,mark1)]
+            if count != [b-a for a,b in zip(mark1,mark2)]:
+                return False
+            params,entities,cstrs = count
+            for h in range(mark0[1]+1,mark1[1]+1):
+                if self.getEntity(h).type != self.getEntity(h+entities).type:
+                    return False
+            for h in range(mark0[2]+1,mark1[2]+1):
+                c0 = self.getConstraint(h)
+                c1 = self.getConstraint(h+cstrs)
+                if (c0.type,c0.other,c0.other2) != \
+                   (c1.type,c1.other,c1.other2):
+                    return False
+            for h in range(mark0[2]+1,mark1[2]+1):
+                self.getConstraint(h).valA = self.getConstraint(h+cstrs).valA
+            for h in range(mark0[0]+1,mark1[0]+1):
+                p = self.getParam(h)
+                if p.group != group:
+                    p.val = self.getParam(h+params).val
+            self.truncate(mark1)
+            return True
 
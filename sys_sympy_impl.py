@@ -0,0 +1,1860 @@
+from collections import namedtuple
+import pprint, random, math, itertools
+from .system import SystemExtension
+from .utils import syslogger as logger, objName
+import sympy as sp
+import sympy.vector as spv
+import scipy.optimize as sopt
+import numpy as np
+
+class _Base(object):
+    __slots__ = ('_symobj','group','solvingGroup','_name','handle')
+
+    def __init__(self,name,g):
+        self._symobj = None
+        self.group = g
+        self.solvingGroup = None
+        self._name = name
+        self.handle = -1
+
+    def reset(self,g):
+        self.solvingGroup = g
+        self._symobj = None
+
+    @property
+    def Name(self):
+        if self._name:
+            return '{}<{}>'.format(self._name,self.__class__.__name__[1:])
+        return '<unknown>'
+
+    @property
+    def SymObj(self):
+        if self._symobj is None:
+            self._symobj = self.getSymObj()
+        return self._symobj
+
+    @property
+    def SymStr(self):
+        sym = self.SymObj
+        if isinstance(sym,spv.Vector):
+            sym = spv.express(sym,_gref)
+        if sym:
+            return '{} = {}'.format(self._name, sym)
+
+    def getSymObj(self):
+        return None
+
+    def __repr__(self):
+        return '"{}"'.format(self.__class__.__name__[1:])
+
+
+class _ParamStore(object):
+    '''
+    Contiguous storage of parameter values, indexed by the order of creation
+    '''
+    __slots__ = ('values','count')
+
+    def __init__(self,capacity=64):
+        self.values = np.zeros(capacity)
+        self.count = 0
+
+    def add(self,v):
+        if self.count == len(self.values):
+            values = np.zeros(2*len(self.values))
+            values[:self.count] = self.values
+            self.values = values
+        self.values[self.count] = v
+        self.count += 1
+        return self.count-1
+
+
+class _Param(_Base):
+    __slots__ = ('_store','_index','_dummy','_value','driving')
+
+    def __init__(self,name,v,g,store=None):
+        super(_Param,self).__init__(name,g)
+        if store is None:
+            store = _ParamStore(1)
+        self._store = store
+        self._index = store.add(v)
+        self._dummy = None
+        self._value = None
+        # A driving parameter is not solved, but kept as a symbol in the
+        # equations, so that its value can be changed without generating the
+        # equations again
+        self.driving = False
+
+    @property
+    def val(self):
+        return self._store.values[self._index]
+
+    @val.setter
+    def val(self,v):
+        self._store.values[self._index] = v
+
+    @property
+    def _sym(self):
+        # Creating sympy Dummy is relatively expensive, and the symbol is
+        # not needed by parameters that are never solved
+        if self._dummy is None:
+            self._dummy = sp.Dummy(self._name,real=True)
+        return self._dummy
+
+    @property
+    def _val(self):
+        if self._value is None:
+            self._value = sp.Float(self.val)
+        return self._value
+
+    @_val.setter
+    def _val(self,v):
+        self._value = v
+
+    def getSymObj(self):
+        return self._sym
+
+    def reset(self,g):
+        if self.group == g or self.driving:
+            self._symobj = self._sym
+        else:
+            self._symobj = self._val
+
+    @property
+    def Name(self):
+        return '_' + self._name
+
+    @property
+    def _repr(self):
+        return self.val
+
+    def __repr__(self):
+        return '_{}:{}'.format(self._name,self._val)
+
+class _MetaType(type):
+    _types = []
+    _typeMap = {}
+
+    def __new__(mcs, name, bases, attrs):
+        # Generate __slots__ from the declared arguments, because there can
+        # be a large number of entities and constraints
+        if '__slots__' not in attrs:
+            names = list(attrs.get('_args',()))
+            for k in attrs.get('_opts',()):
+                names.append(k[0] if isinstance(k,tuple) else k)
+            slots = []
+            for k in names:
+                if k not in slots and k not in attrs and \
+                   not any([hasattr(base,k) for base in bases]):
+                    slots.append(k)
+            attrs['__slots__'] = tuple(slots)
+        return super(_MetaType,mcs).__new__(mcs,name,bases,attrs)
+
+    def __init__(cls, name, bases, attrs):
+        super(_MetaType,cls).__init__(name,bases,attrs)
+        if len(cls._args):
+            logger.trace('registing sympy ' + cls.__name__)
+            mcs = cls.__class__
+            mcs._types.append(cls)
+            mcs._typeMap[cls.__name__[1:]] = cls
+
+    @classmethod
+    def isConstraintSupported(mcs,name):
+        cls = mcs._typeMap.get(name,None)
+        if cls:
+            return issubclass(cls,_Constraint)
+
+
+class _MetaBase(_Base):
+    __metaclass__ = _MetaType
+    _args = ()
+    _opts = ()
+    _vargs = ()
+    def __init__(self,system,args,kargs):
+        cls = self.__class__
+        n = len(cls._args)+len(cls._opts)
+        max_args = n
+        if kargs is None:
+            kargs = {}
+        if 'group' in kargs:
+            g = kargs['group']
+            kargs.pop('group')
+        elif len(args) > n:
+            g = args[n]
+            max_args = n+1
+        else:
+            g = 0
+        if not g:
+            g = system.GroupHandle
+
+        super(_MetaBase,self).__init__(system.Tag,g)
+
+        if len(args) < len(cls._args):
+            raise ValueError('not enough parameters when making ' + str(self))
+        if len(args) > max_args:
+            raise ValueError('too many parameters when making ' + str(self))
+        for i,p in enumerate(args):
+            if i < len(cls._args):
+                setattr(self,cls._args[i],p)
+                continue
+            i -= len(cls._args)
+            if isinstance(cls._opts[i],tuple):
+                setattr(self,cls._opts[i][0],p)
+            else:
+                setattr(self,cls._opts[i],p)
+        for k in self._opts:
+            if isinstance(k,tuple):
+                k,p = k
+            else:
+                p = 0
+            if k in kargs:
+                p = kargs[k]
+                if hasattr(self,k):
+                    raise KeyError('duplicate key "{}" while making '
+                            '{}'.format(k,self))
+                kargs.pop(k)
+            setattr(self,k,p)
+        if len(kargs):
+            for k in kargs:
+                raise KeyError('unknown key "{}" when making {}'.format(
+                    k,self))
+        if cls._vargs:
+            nameTagSave = system.NameTag
+            if nameTagSave:
+                nameTag = nameTagSave + '.' + cls.__name__[1:] + '.'
+            else:
+                nameTag = cls.__name__[1:] + '.'
+            for k in cls._vargs:
+                v = getattr(self,k)
+                system.NameTag = nameTag+k
+                setattr(self,k,system.addParamV(v,g))
+            system.NameTag = nameTagSave
+
+    @property
+    def _repr(self):
+        v = {}
+        cls = self.__class__
+        for k in cls._args:
+            attr = getattr(self,k)
+            v[k] = getattr(attr,'_repr',attr)
+        for k in cls._opts:
+            if isinstance(k,(tuple,list)):
+                attr = getattr(self,k[0])
+                if attr != k[1]:
+                    v[k[0]] = attr
+                continue
+            attr = getattr(self,k)
+            if attr:
+                v[k] = attr
+        return v
+
+    def __repr__(self):
+        return '\n{}:{{\n {}\n'.format(self.Name,
+                pprint.pformat(self._repr,indent=1,width=1)[1:])
+
+    def getEqWithParams(self,_args):
+        return self.getEq()
+
+    def getEq(self):
+        return []
+
+
+if hasattr(spv,'CoordSys3D'):
+    CoordSystem = spv.CoordSys3D
+    CoordSystemName = 'CoordSys3D'
+else:
+    CoordSystem = spv.CoordSysCartesian
+    CoordSystemName = 'CoordSysCartesian'
+_gref = CoordSystem('gref')
+
+def _makeVector(v,ref=None):
+    if not ref:
+        ref = _gref
+    if isinstance(v, spv.Vector):
+        if isinstance(v, spv.VectorZero):
+            return v
+        x,y,z = _vectorComponent(v)
+        return x*ref.i + y*ref.j + z*ref.k
+    x,y,z = v
+    return x.SymObj * ref.i + y.SymObj * ref.j + z.SymObj * ref.k
+
+def _project(wrkpln,*args):
+    if not wrkpln:
+        return [ e.Vector for e in args ]
+    r = wrkpln.CoordSys
+    return [ e.Vector.dot(r.i)+e.Vector.dot(r.j) for e in args ]
+
+def _distance(wrkpln,p1,p2):
+    e1,e2 = _project(wrkpln,p1,p2)
+    return (e1-e2).magnitude()
+
+def _pointPlaneDistance(pt,pln):
+    e = _project(pln,[pt])
+    return (e[0]-pln.origin.Vector).magnitude()
+
+def _pointLineDistance(wrkpln,pt,line):
+    ep,ea,eb = _project(wrkpln,pt,line.p1,line.p2)
+    eab = ea - eb
+    return eab.cross(ea-ep).magnitude()/eab.magnitude()
+
+def _directionConsine(wrkpln,l1,l2,supplement=False):
+    v1,v2 = _project(wrkpln,l1,l2)
+    if supplement:
+        v1 = v1 * -1.0
+    return v1.dot(v2)/(v1.magnitude()*v2.magnitude())
+
+_x = 'i'
+_y = 'j'
+_z = 'k'
+def _vectorComponent(v,*args,**kargs):
+    if not args:
+        args = (_x,_y,_z)
+    if isinstance(v,spv.VectorZero):
+        return [sp.S.Zero]*len(args)
+    v = spv.express(v,_gref)
+    ret = [v.components.get(getattr(_gref,a),sp.S.Zero) for a in args]
+    subs = kargs.get('subs',None)
+    if not subs:
+        return ret
+    return [ c.subs(subs) for c in ret ]
+
+def _vectorsParallel(args,a,b):
+    a = a.Vector
+    b = b.Vector
+    r = a.cross(b)
+
+    #  _ = args
+    #  return r.magnitude()
+    #
+    # SolveSpace does it like below instead of above. Not sure why, but tests
+    # show the below equations have better chance to be solved by various
+    # algorithms
+    #
+    rx,ry,rz = _vectorComponent(r)
+    x,y,z = [ abs(c) for c in _vectorComponent(a,subs=args)]
+    if x > y and x > z:
+        return [ry, rz]
+    elif y > z:
+        return [rz, rx]
+    else:
+        return [rx, ry]
+
+def _vectorsEqual(projected,v1,v2):
+    if projected:
+        x1,y1 = _vectorComponent(v1,_x,_y)
+        x2,y2 = _vectorComponent(v2,_x,_y)
+        return (x1-x2,y1-y2)
+
+    #  return (v1-v2).magnitude()
+    #
+    # SolveSpace does it like below instead of above. See comments in
+    # _vectorsParallel()
+    #
+    x1,y1,z1 = _vectorComponent(v1)
+    x2,y2,z2 = _vectorComponent(v2)
+    return (x1-x2,y1-y2,z1-z2)
+
+
+class _Entity(_MetaBase):
+    @classmethod
+    def make(cls,system):
+        return lambda *args,**kargs :\
+                system.addEntity(cls(system,args,kargs))
+
+    @property
+    def CoordSys(self):
+        return _gref
+
+class _Vector(_Entity):
+    Vector = _Entity.SymObj
+
+    @property
+    def CoordSys(self):
+        return self.Vector.system
+
+class _Point(_Vector):
+    pass
+
+class _Point2d(_Point):
+    _args = ('wrkpln', 'u', 'v')
+
+    def getSymObj(self):
+        r = self.wrkpln.CoordSys
+        return self.u.SymObj * r.i + self.v.SymObj * r.j
+
+class _Point2dV(_Point2d):
+    _vargs = ('u','v')
+
+class _Point3d(_Point):
+    _args = ('x','y','z')
+
+    def getSymObj(self):
+        return _makeVector([self.x,self.y,self.z])
+
+class _Point3dV(_Point3d):
+    _vargs = _Point3d._args
+
+class _Normal(_Vector):
+    @property
+    def Vector(self):
+        return self.SymObj.k
+
+class _Normal3d(_Normal):
+    _args = ('qw','qx','qy','qz')
+
+    @property
+    def Q(self):
+        return self.qw.SymObj,self.qx.SymObj,self.qy.SymObj,self.qz.SymObj
+
+    def getSymObj(self):
+        name = self._name if self._name else 'R'
+        return _gref.orient_new_quaternion(name,*self.Q)
+
+    def getEq(self):
+        # make sure the quaternion are normalized
+        return sp.Matrix(self.Q).norm() - 1.0
+
+    @property
+    def SymStr(self):
+        return '{} = gref.orient_new_quaternion("{}",{},{},{},{})'.format(
+                self._name, self._name, self.qw.SymObj,
+                self.qx.SymObj,self.qy.SymObj,self.qz.SymObj)
+
+
+class _Normal3dV(_Normal3d):
+    _vargs = _Normal3d._args
+
+class _Normal2d(_Normal):
+    _args = ('wrkpln',)
+
+    @property
+    def Q(self):
+        return self.wrkpln.normal.Q
+
+    def getSymObj(self):
+        return self.wrkpln.normal.SymObj
+
+class _Distance(_Entity):
+    _args = ('d',)
+
+    def getSymObj(self):
+        return sp.Float(self.d)
+
+class _DistanceV(_Distance):
+    _vargs = _Distance._args
+
+class _LineSegment(_Vector):
+    _args = ('p1','p2')
+
+    def getSymObj(self):
+        return self.p1.Vector - self.p2.Vector
+
+#  class _Cubic(_Entity):
+#      _args = ('wrkpln', 'p1', 'p2', 'p3', 'p4')
+
+class _ArcOfCircle(_Entity):
+    _args = ('wrkpln', 'center', 'start', 'end')
+
+    @property
+    def CoordSys(self):
+        return self.wrkpln.SymObj
+
+    def getSymObj(self):
+        return _project(self.wrkpln,self.center,self.start,self.end)
+
+    @property
+    def Center(self):
+        return self.SymObj[0]
+
+    @property
+    def Start(self):
+        return self.SymObj[1]
+
+    @property
+    def End(self):
+        return self.SymObj[2]
+
+    @property
+    def Radius(self):
+        return (self.Center-self.Start).magnitude()
+
+    def getEq(self):
+        return self.Radius - (self.Center-self.End).magnitude()
+
+class _Circle(_Entity):
+    _args = ('center', 'normal', 'radius')
+
+    @property
+    def Radius(self):
+        return self.radius.SymObj
+
+    @property
+    def Center(self):
+        return self.SymObj
+
+    def getSymObj(self):
+        return self.center.Vector
+
+    @property
+    def CoodSys(self):
+        return self.normal.SymObj
+
+class _CircleV(_Circle):
+    _vargs = _Circle._args
+
+class _Workplane(_Entity):
+    _args = ('origin', 'normal')
+
+    def getSymObj(self):
+        name = self._name if self._name else 'W'
+        return self.normal.SymObj.locate_new(name,self.origin.Vector)
+
+    @property
+    def SymStr(self):
+        return '{} = {}.locate_new("{}",{})'.format(self._name,
+                self.normal._name, self._name, self.origin.Vector)
+
+    @property
+    def CoordSys(self):
+        return self.SymObj
+
+class _Translate(_Vector):
+    _args = ('src', 'dx', 'dy', 'dz')
+    #  _opts = (('scale',1.0), 'timesApplied')
+
+    @property
+    def Vector(self):
+        e = self.SymObj
+        if isinstance(e,spv.Vector):
+            return e
+        else:
+            return e.k
+
+    def getSymObj(self):
+        e = self.src.SymObj
+        if isinstance(e,spv.Vector):
+            return e+_makeVector([self.dx,self.dy,self.dz])
+        elif isinstance(e,CoordSystem):
+            # This means src is a normal, and we don't translate normal in order
+            # to be compatibable with solvespace
+            logger.warn('{} translating normal has no effect'.format(self.Name))
+            return e
+        else:
+            raise ValueError('unsupported transformation {} of '
+                '{} with type {}'.format(self.Name,self.src,e))
+
+class _Transform(_Translate):
+    _args = ('src', 'dx', 'dy', 'dz', 'qw', 'qx', 'qy', 'qz')
+    _opts = (('asAxisAngle',False),
+             # no support for scal and timesApplied yet
+             #  ('scale',1.0),'timesApplied'
+             )
+
+    @property
+    def Offset(self):
+        return _makeVector([self.dx,self.dy,self.dz])
+
+    @property
+    def Q(self):
+        return self.qw.SymObj,self.qx.SymObj,self.qy.SymObj,self.qz.SymObj
+
+    @property
+    def Axis(self):
+        return _makeVector([self.qx,self.qy,self.qz])
+
+    @property
+    def Angle(self):
+        return self.qw.SymObj*sp.pi/180.0
+
+    @property
+    def Orienter(self):
+        if self.asAxisAngle:
+            return spv.AxisOrienter(self.Angle, self.Axis)
+        else:
+            return spv.QuaternionOrienter(*self.Q)
+
+    def getSymObj(self):
+        e = self.src.SymObj
+        if isinstance(e,spv.Vector):
+            if isinstance(e,spv.VectorZero):
+                return self.Offset
+            ref = _gref.orient_new(self._name+'_r',self.Orienter)
+            return _makeVector(e,ref) + self.Offset
+
+        # TODO: probably should do this to support cascaded transform, e.g. a
+        # transformed normal of another transformed normal. But we don't
+        # currently have that in the constraint system.
+        #
+        #  if isinstance(e,CoordSystem):
+        #      mat = self.Orienter.rotation_matrix(_gref)*\
+        #              e.rotation_matrix(_gref)
+        #      return CoordSystem(self.name_,rotation_matrix=mat,parent=_gref)
+
+        if isinstance(self.src, _Normal):
+            ref = _gref.orient_new(self._name+'_r',self.Orienter)
+            return ref.orient_new_quaternion(self._name,*self.src.Q)
+
+        raise ValueError('unknown transformation {} of '
+            '{} with type {}'.format(self.Name,self.src,e))
+
+    @property
+    def SymStr(self):
+        if self.asAxisAngle:
+            txt='{}_r=gref.orient_new_axis("{}_r",{},{})'.format(
+                    self._name,self._name,self.Angle,self.Axis)
+        else:
+            txt='{}_r=gref.orient_new_quaternion("{}_r",{},{},{},{})'.format(
+                    self._name,self._name,*self.Q)
+
+        if isinstance(self.SymObj,spv.Vector):
+            return '{}\n{}={}'.format(txt,self._name,self.SymObj)
+
+        return '{}\n{}={}_r.orient_new_quaternion("{}",{},{},{},{})'.format(
+                    txt,self._name,self._name,self._name,*self.Q)
+
+class _Constraint(_MetaBase):
+    @classmethod
+    def make(cls,system):
+        return lambda *args,**kargs :\
+                system.addConstraint(cls(system,args,kargs))
+
+class _ProjectingConstraint(_Constraint):
+    _opts = ('wrkpln',)
+
+    def project(self,*args):
+        return _project(self.wrkpln,*args)
+
+class _PointsDistance(_ProjectingConstraint):
+    _args = ('d', 'p1', 'p2',)
+
+    def getEq(self):
+        return _distance(self.wrkpln,self.p1,self.p2) - self.d
+
+class _PointsProjectDistance(_Constraint):
+    _args = ('d', 'p1', 'p2', 'line')
+
+    def getEq(self):
+        dp = self.p1.Vector - self.p2.Vector
+        pp = self.line.Vector.normalize()
+        return dp.dot(pp) - self.d
+
+class _PointsCoincident(_ProjectingConstraint):
+    _args = ('p1', 'p2',)
+
+    def getEq(self):
+        p1,p2 = self.project(self.p1,self.p2)
+        return _vectorsEqual(self.wrkpln,p1,p2)
+
+class _PointInPlane(_ProjectingConstraint):
+    _args = ('pt', 'pln')
+
+    def getEq(self):
+        return _pointPlaneDistance(self.pt,self.pln)
+
+class _PointPlaneDistance(_ProjectingConstraint):
+    _args = ('d', 'pt', 'pln')
+
+    def getEq(self):
+        return _pointPlaneDistance(self.pt,self.pln) - self.d.SymObj
+
+class _PointOnLine(_ProjectingConstraint):
+    _args = ('pt', 'line',)
+
+    def getEq(self):
+        return _pointLineDistance(self.wrkpln,self.pt,self.line)
+
+class _PointLineDistance(_ProjectingConstraint):
+    _args = ('d', 'pt', 'line')
+
+    def getEq(self):
+        d = _pointLineDistance(self.wrkpln,self.pt,self.line)
+        return d**2 - self.d.SymObj**2
+
+class _EqualLength(_ProjectingConstraint):
+    _args = ('l1', 'l2',)
+
+    @property
+    def Distance1(self):
+        return _distance(self.wrkpln,self.l1.p1,self.l1.p2)
+
+    @property
+    def Distance2(self):
+        return _distance(self.wrkpln,self.l2.p1,self.l2.p2)
+
+    def getEq(self):
+        return self.Distance1 - self.Distance2
+
+class _LengthRatio(_EqualLength):
+    _args = ('ratio', 'l1', 'l2',)
+
+    def getEq(self):
+        return self.Distance1/self.Distance2 - self.ratio.SymObj
+
+class _LengthDifference(_EqualLength):
+    _args = ('diff', 'l1', 'l2',)
+
+    def getEq(self):
+        return self.Distance1 - self.Distance2 - self.diff.SymObj
+
+class _EqualLengthPointLineDistance(_EqualLength):
+    _args = ('pt','l1','l2')
+
+    @property
+    def Distance2(self):
+        return _pointLineDistance(self.wrkpln,self.pt,self.l2)
+
+    def getEq(self):
+        return self.Distance1**2 - self.Distance2**2
+
+class _EqualPointLineDistance(_EqualLengthPointLineDistance):
+    _args = ('p1','l1','p2','l2')
+
+    @property
+    def Distance1(self):
+        return _pointLineDistance(self.wrkpln,self.p1,self.l1)
+
+    @property
+    def Distance2(self):
+        return _pointLineDistance(self.wrkpln,self.p1,self.l2)
+
+class _EqualAngle(_ProjectingConstraint):
+    _args = ('supplement', 'l1', 'l2', 'l3', 'l4')
+
+    @property
+    def Angle1(self):
+        return _directionConsine(self.wrkpln,self.l1,self.l2,self.supplement)
+
+    @property
+    def Angle2(self):
+        return _directionConsine(self.wrkpln,self.l3,self.l4)
+
+    def getEq(self):
+        return self.Angle1 - self.Angle2
+
+class _EqualLineArcLength(_ProjectingConstraint):
+    _args = ('line', 'arc')
+
+    def getEq(self):
+        raise NotImplementedError('not implemented')
+
+class _Symmetric(_ProjectingConstraint):
+    _args = ('p1', 'p2', 'pln')
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.p1,self.p2)
+        m = (e1-e2)*0.5
+
+        eq = []
+        # first equation, mid point of p1 and p2 coincide with pln's origin
+        eq += _vectorsEqual(0,m,self.pln.origin.Vector)
+
+        e1,e2 = _project(self.pln,self.p1,self.p2)
+        # second equation, p1 and p2 cincide when project to pln
+        eq += _vectorsEqual(self.pln,e1,e2)
+        return eq
+
+class _SymmetricHorizontal(_Constraint):
+    _args = ('p1', 'p2', 'wrkpln')
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.p1,self.p2)
+        x1,y1 = _vectorComponent(e1,_x,_y)
+        x2,y2 = _vectorComponent(e2,_x,_y)
+        return [x1+x2,y1-y2]
+
+class _SymmetricVertical(_Constraint):
+    _args = ('p1', 'p2', 'wrkpln')
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.p1,self.p2)
+        x1,y1 = _vectorComponent(e1,_x,_y)
+        x2,y2 = _vectorComponent(e2,_x,_y)
+        return [x1-x2,y1+y2]
+
+class _SymmetricLine(_Constraint):
+    _args = ('p1', 'p2', 'line', 'wrkpln')
+
+    def getEq(self):
+        e1,e2,le1,le2 = _project(self.wrkpln, self.p1, self.p2,
+                self.line.p1, self.line.p2)
+        return (e1-e2).dot(le1-le2)
+
+class _MidPoint(_ProjectingConstraint):
+    _args = ('pt', 'line')
+
+    def getEq(self):
+        e,le1,le2 = _project(self.wrkpln,self.pt,self.line.p1,self.line.p2)
+        return _vectorsEqual(self.wrkpln,e,(le1-le2)*0.5)
+
+class _PointsHorizontal(_ProjectingConstraint):
+    _args = ('p1', 'p2')
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.p1,self.p2)
+        x1, = _vectorComponent(e1,_x)
+        x2, = _vectorComponent(e2,_x)
+        return x1-x2
+
+class _PointsVertical(_ProjectingConstraint):
+    _args = ('p1', 'p2')
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.p1,self.p2)
+        y1, = _vectorComponent(e1,_y)
+        y2, = _vectorComponent(e2,_y)
+        return y1-y2
+
+class _LineHorizontal(_ProjectingConstraint):
+    _args = ('line',)
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.line.p1,self.line.p2)
+        x1, = _vectorComponent(e1,_x)
+        x2, = _vectorComponent(e2,_x)
+        return x1-x2
+
+class _LineVertical(_ProjectingConstraint):
+    _args = ('line',)
+
+    def getEq(self):
+        e1,e2 = _project(self.wrkpln,self.line.p1,self.line.p2)
+        y1, = _vectorComponent(e1,_y)
+        y2, = _vectorComponent(e2,_y)
+        return y1-y2
+
+class _Diameter(_Constraint):
+    _args = ('d', 'c')
+
+    def getEq(self):
+        return self.c.Radius*2 - self.d.SymObj
+
+class _PointOnCircle(_Constraint):
+    _args = ('pt', 'circle')
+
+    def getEq(self):
+        # to be camptible with slvs, this actual constraint the point to the
+        # cylinder
+        e = _project(self.circle.normal,self.pt)
+        return self.circle.Radius - (e-self.center.Vector).magnitude()
+
+class _SameOrientation(_Constraint):
+    _args = ('n1', 'n2')
+
+    def getEqWithParams(self,args):
+        if self.n1.group == self.solvingGroup:
+            n1,n2 = self.n2,self.n1
+        else:
+            n1,n2 = self.n1,self.n2
+        eqs = _vectorsParallel(args,n1,n2)
+        d1 = n1.CoordSys.i.dot(n2.CoordSys.j)
+        d2 = n1.CoordSys.i.dot(n2.CoordSys.i)
+        if abs(d1.subs(args)) < abs(d2.subs(args)):
+            eqs.append(d1)
+        else:
+            eqs.append(d2)
+        return eqs
+
+class _Angle(_ProjectingConstraint):
+    _args = ('degree', 'supplement', 'l1', 'l2',)
+
+    @property
+    def DirectionCosine(self):
+        return _directionConsine(self.wrkpln,self.l1,self.l2,self.supplement)
+
+    def getEq(self):
+        return self.DirectionCosine - sp.cos(sp.pi*self.degree/180.0)
+
+class _Perpendicular(_Angle):
+    _args = ('l1', 'l2',)
+
+    def getEq(self):
+        return self.DirectionConsine
+
+class _Parallel(_ProjectingConstraint):
+    _args = ('l1', 'l2',)
+
+    def getEqWithParams(self,args):
+        if self.l1.group == self.solvingGroup:
+            l1,l2 = self.l2,self.l1
+        else:
+            l1,l2 = self.l1,self.l2
+        if not self.wrkpln:
+            return _vectorsParallel(args,l1,l2)
+        return l1.Vector.cross(l2.Vector).dot(self.wrkpln.normal.Vector)
+
+#  class _ArcLineTangent(_Constraint):
+#      _args = ('atEnd', 'arc', 'line')
+#
+#  class _CubicLineTangent(_Constraint):
+#      _args = ('atEnd', 'cubic', 'line')
+#      _opts = ('wrkpln',)
+#
+#  class _CurvesTangent(_Constraint):
+#      _args = ('atEnd1', 'atEnd2', 'c1', 'c2', 'wrkpln')
+
+class _EqualRadius(_Constraint):
+    _args = ('c1', 'c2')
+
+    def getEq(self):
+        return self.c1.Radius - self.c2.Radius
+
+#  class _WhereDragged(_ProjectingConstraint):
+#      _args = ('pt',)
+
+def _isValue(v):
+    return isinstance(v,(int,float)) and not isinstance(v,bool)
+
+# Version of the system structure and of the driving parameters, which is
+# unique across all systems, so that a version restored by truncate() never
+# matches anything else
+_versions = itertools.count(1)
+
+class _SystemSymPy(SystemExtension):
+    def __init__(self,parent,algo):
+        super(_SystemSymPy,self).__init__()
+        self.GroupHandle = 1
+        self.NameTag = '?'
+        self.Dof = -1
+        self.Failed = []
+        self.Store = _ParamStore()
+        self.Params = []
+        self.Constraints = []
+        self.Entities = []
+        self.eqs = []
+        self.algo = algo
+        self.race = False
+        self.multiStart = 0
+        self.scaling = False
+        self.lengthScale = 1.0
+        self.Quaternions = []
+        # driving parameters, see updateValues()
+        self.Driving = []
+        # (constraint,argument name) -> driving parameter
+        self.DrivingArgs = {}
+        self._version = next(_versions)
+        self._drivingVersion = 0
+        self._compiled = None
+        self.log = parent.log
+        self.verbose = parent.verbose
+
+        for cls in _MetaType._types:
+            name = 'add' + cls.__name__[1:]
+            setattr(self,name,cls.make(self))
+
+    def reset(self):
+        self.__init__()
+
+    def F(self,params,eq,jeqs,_heqs,extra=()):
+        params = tuple(params) + extra
+        res = eq(*params)
+        if not jeqs:
+            return res
+        return (res,np.array([jeq(*params) for jeq in jeqs]))
+
+    def hessF(self,params,_eqs,_jeqs,heqs,extra=()):
+        params = tuple(params) + extra
+        return np.array([[eq(*params) for eq in eqs] for eqs in heqs])
+
+    EquationInfo = namedtuple('EquationInfo',('Name','Expr'))
+
+    # Generated equations of the last solve, reused as long as the system
+    # structure is not changed. 'Substitutes' is a list of tuple(param,expr,
+    # dep) for the parameters substituted by an expression of another one.
+    # 'Functions' is the lambdified objective, filled on first use.
+    Compiled = namedtuple('Compiled',('Key','Equations','Params','Indices',
+        'Objective','Scales','Substitutes','Driving','Functions'))
+
+    def solve(self, group=0, reportFailed=False):
+        _ = reportFailed
+        if not group:
+            group = self.GroupHandle
+        presolved = []
+        try:
+            self._solve(group,presolved)
+        finally:
+            # Restore the presolved parameters, so that the system can be
+            # solved again, e.g. after changing some constraint.
+            for param in presolved:
+                param.group = group
+                param._val = None
+
+    def _solve(self,group,presolved):
+        if self.verbose:
+            # print out symbol names and values, and verbose symbolic equations
+            # for debugging purpose
+            pvalues = []
+            pnames = []
+            params = {}
+            for p in self.Params:
+                params[p._sym] = p._val
+                pvalues.append(str(p))
+                pnames.append(p.Name)
+            self.log('from sympy import symbols,sqrt\n'
+                     'import sympy as sp\n'
+                     'import sympy.vector as spv\n'
+                     'gref=spv.{}("gref")\n'
+                     '{} = symbols("{}")\n'
+                     'eqs = {{}}\n'
+                     'params = {{{}}}\n',
+                         CoordSystemName,
+                         ','.join(pnames),
+                         ' '.join(pnames),
+                         ','.join(pvalues))
+            j=0
+            for objs in (self.Entities,self.Constraints):
+                for o in objs:
+                    sym = o.SymStr
+                    if sym:
+                        self.log('\n{}: {}\n',o.Name,sym)
+                    if o.group != group:
+                        continue
+                    eq = o.getEqWithParams(params)
+                    if not eq:
+                        continue
+                    i=0
+                    for e in eq if isinstance(eq,(list,tuple)) else [eq]:
+                        self.log('\n{} {}: eq[{}] = {}\n',o.Name,i,j,eq)
+                        j=j+1
+                        i=i+1
+
+        key = (self._version,self._drivingVersion,group,self.algo.getName(),
+                self.scaling,self.lengthScale)
+        compiled = self._compiled
+        if compiled and compiled.Key == key:
+            self.log('reuse the equations of the last solve')
+        else:
+            self._compiled = None
+            compiled = self.compile(key,group,presolved)
+            if not compiled:
+                return
+            self._compiled = compiled
+
+        params = compiled.Params
+        scales = compiled.Scales
+        # initial values, sliced from the contiguous value array
+        x0 = self.Store.values[compiled.Indices]
+        if scales is not None:
+            x0 = x0/scales
+        extra = tuple([p.val for p in compiled.Driving])
+        f = compiled.Objective
+
+        self.log('solving {} equations, with {} parameters',
+            len(compiled.Equations),len(params))
+        logger.record('debug','sympy equations','','',
+                len(compiled.Equations),len(params))
+
+        ret = None
+        if self.multiStart > 1 or self.race:
+            if extra:
+                # the worker processes only take the parameters to be solved
+                f = f.xreplace(dict([(p._sym,sp.Float(v))
+                    for p,v in zip(compiled.Driving,extra)]))
+            if self.multiStart > 1:
+                ret = logger.catch('multi-start solving failed',
+                        self.minimizeMultiStart,f,params,x0)
+            else:
+                ret = logger.catch('parallel solving failed',
+                        self.minimizeParallel,f,params,x0)
+        if ret is None:
+            funcs = compiled.Functions
+            if funcs is None:
+                funcs = self.lambdifyObjective(compiled.Objective,params,
+                        list(params)+[p._sym for p in compiled.Driving])
+                self._compiled = compiled._replace(Functions=funcs)
+            ret = self.minimize(compiled.Objective,params,x0,funcs,extra)
+        if ret.success:
+            values = ret.x if scales is None else np.asarray(ret.x)*scales
+            self.Store.values[compiled.Indices] = values
+            for y,expr,x in compiled.Substitutes:
+                if x is not None:
+                    expr = expr.xreplace({x._sym:sp.Float(x.val)})
+                y.val = float(expr)
+            self.log('solver success: {}',ret.message)
+        else:
+            raise RuntimeError('failed to solve: {}'.format(ret.message))
+
+    def compile(self,key,group,presolved):
+        '''
+        Generate the equations of the given group, and return them as
+        Compiled, or None if there is nothing to solve. Equations of a single
+        parameter are solved right away, and parameters depending linearly on
+        another one are substituted. Equations involving driving parameters
+        are left to the solver, so that the result stays valid when the
+        driving parameters change.
+        '''
+        algo = self.algo
+        driving = list(self.Driving)
+        drivingSyms = set([p._sym for p in driving])
+
+        # for params that can be represent by another single param, maps
+        # the substituted _Param object to the one it depends on
+        param_subs = {}
+
+        while True:
+            # restart equation generation if any equation can be solved earlier
+            restart = False
+            params = {} # symbol -> value
+            param_table = {} # symbol -> _Param object
+            for e in self.Params:
+                e.reset(group)
+                if e.group == group and not e.driving:
+                    params[e._sym] = e.val
+                    param_table[e._sym] = e
+            if not params:
+                self.log('no parameter')
+                return
+            for e in self.Constraints:
+                e.reset(group)
+            for e in self.Entities:
+                e.reset(group)
+
+            # values of all symbols, used by some constraints to choose their
+            # equations
+            args = dict(params)
+            for p in driving:
+                args[p._sym] = p.val
+
+            self.log('generating equations...')
+
+            eqs = []
+            # symbol -> index of the parameter value in self.Store
+            active_params = {}
+            for objs in (self.Entities,self.Constraints):
+                for o in objs:
+                    if o.group != group:
+                        continue
+                    eq = o.getEqWithParams(args)
+                    if not eq:
+                        continue
+                    for e in eq if isinstance(eq,(list,tuple)) else [eq]:
+                        symbols = e.free_symbols
+                        if self.verbose:
+                            self.log('\n\nequation {}: {}\n\n',o.Name,e)
+                        isDriven = not drivingSyms.isdisjoint(symbols)
+                        if isDriven:
+                            symbols = symbols - drivingSyms
+                        if not symbols:
+                            self.log('skip equation without free symbol')
+                            continue
+                        if len(symbols)==1 and not isDriven:
+                            self.log('single solve')
+                            x = symbols.pop()
+                            if x not in param_table:
+                                logger.warn('skip equation with unknown symbol')
+                                continue
+                            param = param_table[x]
+                            v = self.solveSingle(e,x,param.val,algo.Tolerance)
+                            if v is None:
+                                logger.warn('failed to solve {}',o.Name)
+                            else:
+                                self.log('single solve done: {}',v)
+                                restart = True
+                                param.group = -1
+                                presolved.append(param)
+                                param.val = v
+                                param._val = sp.Float(v)
+                                param_table.pop(x)
+                                for y,dep in param_subs.items():
+                                    if dep is param:
+                                        y._val = y._val.xreplace({x:param._val})
+                                continue
+                        if len(symbols)==2 and not isDriven:
+                            x = symbols.pop()
+                            y = symbols.pop()
+                            self.log('simple solve2')
+                            ret = self.solveLinear(e,y)
+                            if ret is None:
+                                x,y = y,x
+                                ret = self.solveLinear(e,y)
+                            # do not substitute a param that others depend
+                            # on, to avoid chained substitution
+                            if ret is not None and \
+                               x in param_table and y in param_table and \
+                               param_table[y] not in param_subs.values():
+                                param_subs[param_table[y]] = param_table[x]
+                                param = param_table[y]
+                                param.group = -2
+                                presolved.append(param)
+                                param._val = ret
+                                param_table.pop(y)
+                                self.log('simple solve done: {}',param)
+                                restart = True
+                                continue
+
+                        if not restart:
+                            if len(active_params)!=len(params):
+                                for x in symbols:
+                                    if x not in active_params:
+                                        active_params[x] = \
+                                                param_table[x]._index
+                            self.log('add equation')
+                            eqs.append(self.EquationInfo(Name=o.Name, Expr=e))
+            if not restart:
+                break
+
+        if not eqs:
+            logger.error('no constraint')
+            return
+
+        self.log('parameters {}, {}, {}',len(self.Params),
+            len(params),len(active_params))
+
+        # all parameters to be solved
+        params = list(active_params.keys())
+        indices = np.array(list(active_params.values()),dtype=int)
+
+        scales = None
+        if self.scaling:
+            f,_,scales = self.normalize(eqs,params,self.Store.values[indices],
+                    dict([(p._sym,p.val) for p in driving]))
+        else:
+            # For holding the sum of square of all equations, which is the
+            # one we are trying to minimize
+            f = None
+            for eq in eqs:
+                e = eq.Expr**2
+                f = e if f is None else f+e
+
+        substitutes = []
+        for y,x in param_subs.items():
+            # a presolved parameter is already substituted by its value
+            substitutes.append((y,y._val,None if x.group==-1 else x))
+
+        self.log('generated {} equations, with {} parameters',
+            len(eqs),len(params))
+        return self.Compiled(Key=key,
+                             Equations=eqs,
+                             Params=params,
+                             Indices=indices,
+                             Objective=f,
+                             Scales=scales,
+                             Substitutes=substitutes,
+                             Driving=driving,
+                             Functions=None)
+
+    @staticmethod
+    def solveSingle(e,x,x0,tol=None):
+        '''
+        Solve a single variable equation e(x)=0. Linear and quadratic
+        equations are solved in closed form, and the root closest to the
+        initial value 'x0' is chosen. Other equations are solved by bracketed
+        root finding around 'x0'. Return None if no root is found.
+        '''
+        try:
+            poly = sp.Poly(e,x)
+            coeffs = [float(c) for c in poly.all_coeffs()]
+        except (sp.PolynomialError,TypeError):
+            coeffs = None
+        if coeffs and len(coeffs)<=3:
+            coeffs = [0.0]*(3-len(coeffs)) + coeffs
+            a,b,c = coeffs
+            if abs(a) < 1e-15:
+                if abs(b) < 1e-15:
+                    return
+                return -c/b
+            disc = b*b-4*a*c
+            if disc < 0:
+                if disc < -1e-12*max(b*b,abs(4*a*c),1.0):
+                    return
+                disc = 0.0
+            # numerically stable quadratic formula
+            q = -0.5*(b+math.copysign(math.sqrt(disc),b))
+            roots = [q/a]
+            if q != 0:
+                roots.append(c/q)
+            return min(roots,key=lambda r:abs(r-x0))
+
+        f = sp.lambdify(x,e,modules='numpy')
+        try:
+            f0 = float(f(x0))
+            if f0 == 0:
+                return x0
+            xtol = tol if tol else 1e-12
+            step = max(abs(x0),1.0)*1e-2
+            # the last sample of each side, (x,f(x))
+            last = [(x0,f0),(x0,f0)]
+            for _ in range(40):
+                # Expand on both sides, and check the sign change against the
+                # last sample of the same side, so that the root found is on
+                # the nearest bracket of each side
+                roots = []
+                for i,x1 in enumerate((x0-step,x0+step)):
+                    f1 = float(f(x1))
+                    xp,fp = last[i]
+                    last[i] = (x1,f1)
+                    if fp*f1 <= 0:
+                        a,b = (x1,xp) if x1<xp else (xp,x1)
+                        roots.append(sopt.brentq(f,a,b,xtol=xtol))
+                if roots:
+                    return min(roots,key=lambda r:abs(r-x0))
+                step *= 2
+        except (ValueError,ZeroDivisionError,RuntimeError) as excp:
+            logger.warn('bracketed solve failed: {}',excp)
+
+    @staticmethod
+    def solveLinear(e,y):
+        '''
+        Solve equation e=0 for 'y' in closed form if 'e' is linear in 'y'
+        with a constant coefficient. Return the solution as an expression of
+        the other symbol, or None.
+        '''
+        try:
+            poly = sp.Poly(e,y)
+        except sp.PolynomialError:
+            return
+        if poly.degree() != 1:
+            return
+        a,b = poly.all_coeffs()
+        if not a.is_number or abs(float(a))<1e-15:
+            return
+        return -b/a
+
+    def getScales(self,params):
+        '''
+        Return the scale of each parameter. Quaternion parameters are already
+        normalized, and all the others are treated as lengths.
+        '''
+        quaternions = set([p._sym for q in self.Quaternions for p in q])
+        scale = self.lengthScale if self.lengthScale>0 else 1.0
+        return np.array([1.0 if x in quaternions else scale for x in params])
+
+    def normalize(self,eqs,params,x0,driving=None,samples=8,step=1e-6):
+        '''
+        Return the objective function in terms of scaled parameters, i.e.
+        x = scale*u, together with the scaled initial values and the scales.
+        Each equation is normalized by the estimated norm of its gradient
+        with respect to the scaled parameters before being squared, so that
+        equations of lengths and angles are weighted similarly. 'driving'
+        maps the driving symbols to their current values, which are only used
+        for estimating the weights.
+        '''
+        scales = self.getScales(params)
+        subs = dict([(x,s*x) for x,s in zip(params,scales) if s!=1.0])
+        exprs = [eq.Expr.xreplace(subs) if subs else eq.Expr for eq in eqs]
+        u0 = np.array(x0,dtype=float)/scales
+
+        # Estimate the gradient norm of each equation using finite
+        # differences along random directions, which is much cheaper than
+        # evaluating the full Jacobian matrix.
+        func = sp.lambdify(params,[e.xreplace(driving) if driving else e
+            for e in exprs],modules='numpy')
+        e0 = np.array(func(*u0),dtype=float)
+        norms = np.zeros(len(exprs))
+        rand = np.random.RandomState(len(params))
+        for _ in range(samples):
+            v = rand.standard_normal(len(params))
+            e1 = np.array(func(*(u0+step*v)),dtype=float)
+            norms += ((e1-e0)/step)**2
+        weights = 1.0/np.clip(np.sqrt(norms/samples),1e-3,1e6)
+
+        f = None
+        for w,e in zip(weights,exprs):
+            e = (sp.Float(w)*e)**2
+            f = e if f is None else f+e
+        self.log('scaled parameters by {}, equation weights {}~{}',
+                self.lengthScale,weights.min(),weights.max())
+        return f,list(u0),scales
+
+    def lambdifyObjective(self,f,params,args):
+        '''
+        Lambdify the objective function together with its Jacobian and
+        Hessian matrix as required by the algorithm. The functions take
+        'args', i.e. the parameters to be solved followed by any extra ones.
+        '''
+        algo = self.algo
+        eq = sp.lambdify(args,f,modules='numpy')
+
+        jeqs = None
+        heqs = None
+        if algo.NeedJacobian or algo.NeedHessian:
+            # Jacobian matrix in sympy expressions
+            jexprs = [f.diff(x) for x in params]
+
+            if algo.NeedJacobian:
+                # Lambdified Jacobian matrix
+                jeqs = [sp.lambdify(args,je,modules='numpy') for je in jexprs]
+                self.log('generated jacobian matrix')
+
+            if algo.NeedHessian:
+                # Lambdified Hessian matrix
+                heqs = [[sp.lambdify(args,je.diff(x),modules='numpy')
+                            for x in params] for je in jexprs ]
+                self.log('generated hessian matrix')
+        return eq,jeqs,heqs
+
+    def minimize(self,f,params,x0,funcs=None,extra=()):
+        algo = self.algo
+        if funcs is None:
+            funcs = self.lambdifyObjective(f,params,params)
+        eq,jeqs,heqs = funcs
+        jac = True if jeqs else None
+        hessF = self.hessF if heqs else None
+
+        ret = sopt.minimize(self.F,x0,(eq,jeqs,heqs,tuple(extra)),
+            jac=jac,hess=hessF,tol=algo.Tolerance,method=algo.getName(),
+            options=algo.Options)
+        #  ret = sopt.minimize(self.F,x0,(eq,None,None),method=algo.getName())
+        logger.record('info' if ret.success else 'error','sympy minimize',
+                '','',algo.getName(),getattr(ret,'nit',None),ret.fun)
+        return ret
+
+    # SciPy algorithms raced against the selected one in race mode
+    RaceAlgorithms = ('BFGS','SLSQP','Powell','L-BFGS-B')
+
+    @staticmethod
+    def serialize(f,params):
+        '''
+        Serialize the expression for the worker processes, with parameters
+        renamed to x0, x1, ...
+        '''
+        symbols = [sp.Symbol('x{}'.format(i),real=True)
+                    for i in range(len(params))]
+        return sp.srepr(f.xreplace(dict(zip(params,symbols))))
+
+    def minimizeParallel(self,f,params,x0):
+        '''
+        Race the selected algorithm against others in worker processes, and
+        take the first converged result. Return None if parallel solving is
+        not supported.
+        '''
+        from . import parallel
+        if not parallel.isSupported():
+            logger.warn('parallel solving is not supported')
+            return
+        algo = self.algo
+        params = list(params)
+        x0 = list(x0)
+        expr = self.serialize(f,params)
+        tasks = [(expr,len(params),x0,algo.getName(),
+                    algo.Tolerance,algo.Options)]
+        for name in self.RaceAlgorithms:
+            if name != algo.getName():
+                tasks.append((expr,len(params),x0,name,algo.Tolerance,None))
+        self.log('racing {}',[task[3] for task in tasks])
+        ret = parallel.race(parallel.minimize,tasks,accept=lambda r:r[0])
+        if not ret:
+            logger.record('error','sympy race','','',len(tasks))
+            return sopt.OptimizeResult(success=False,x=np.array(x0),
+                    fun=None,message='all raced algorithms failed')
+        success,x,fun,msg,method = ret[1]
+        logger.record('info','sympy race','','',method,fun)
+        return sopt.OptimizeResult(success=success,x=np.array(x),fun=fun,
+                message='{}: {}'.format(method,msg))
+
+    def getInitialGuesses(self,params,x0,count):
+        '''
+        Return a list of initial guesses, starting with 'x0', followed by
+        guesses with randomly flipped part rotations, i.e. rotated 180 degree
+        about one of the part's axes.
+        '''
+        index = dict((x,i) for i,x in enumerate(params))
+        quaternions = []
+        for q in self.Quaternions:
+            idx = [index.get(p._sym,None) for p in q]
+            if None not in idx:
+                quaternions.append(idx)
+        ret = [list(x0)]
+        if not quaternions:
+            return ret
+        rand = random.Random(count)
+        for _ in range(count-1):
+            x = list(x0)
+            for idx in quaternions:
+                if rand.random() < 0.5:
+                    continue
+                w,qx,qy,qz = [x[i] for i in idx]
+                a = [0.0,0.0,0.0]
+                a[rand.randint(0,2)] = 1.0
+                # q * (0,a)
+                x[idx[0]] = -(qx*a[0]+qy*a[1]+qz*a[2])
+                x[idx[1]] = w*a[0] + qy*a[2] - qz*a[1]
+                x[idx[2]] = w*a[1] + qz*a[0] - qx*a[2]
+                x[idx[3]] = w*a[2] + qx*a[1] - qy*a[0]
+            ret.append(x)
+        return ret
+
+    def minimizeMultiStart(self,f,params,x0):
+        '''
+        Minimize from multiple initial guesses, and keep the converged
+        result with the lowest residual. The guesses are evaluated in worker
+        processes if possible, or else sequentially.
+        '''
+        from . import parallel
+        algo = self.algo
+        params = list(params)
+        guesses = self.getInitialGuesses(params,x0,self.multiStart)
+        self.log('multi-start with {} initial guesses',len(guesses))
+
+        results = []
+        if parallel.isSupported():
+            expr = self.serialize(f,params)
+            tasks = []
+            names = [algo.getName()]
+            if self.race:
+                names += [n for n in self.RaceAlgorithms if n!=names[0]]
+            for guess in guesses:
+                for name in names:
+                    tasks.append((expr,len(params),guess,name,algo.Tolerance,
+                        algo.Options if name==names[0] else None))
+            for r in parallel.runAll(parallel.minimize,tasks):
+                if r and not isinstance(r,Exception):
+                    success,x,fun,msg,method = r
+                    results.append(sopt.OptimizeResult(success=success,
+                        x=np.array(x),fun=fun,
+                        message='{}: {}'.format(method,msg)))
+        else:
+            for guess in guesses:
+                results.append(self.minimize(f,params,guess))
+
+        best = None
+        for r in results:
+            if r.success and (best is None or r.fun < best.fun):
+                best = r
+        logger.record('info' if best else 'error','sympy multi-start','','',
+                len(guesses),len(results),best.fun if best else None)
+        if best:
+            return best
+        return sopt.OptimizeResult(success=False,x=np.array(x0),fun=None,
+                message='no converged result from {} initial guesses'.format(
+                    len(guesses)))
+
+    def addPlacement(self,pla,group=0):
+        ret = super(_SystemSymPy,self).addPlacement(pla,group)
+        self.Quaternions.append(ret[3:])
+        return ret
+
+    AnalyzeResult = namedtuple('AnalyzeResult',
+            ('Dof','Redundant','GroupDof','Singular'))
+
+    def analyze(self, group=0, paramGroups=None, tol=1e-6):
+        '''
+        Analyze the constraints using the rank of the Jacobian matrix
+        evaluated at the current parameter values. The Jacobian is obtained
+        by finite difference, and analyzed per connected component, i.e.
+        per set of parameters linked together by some equations.
+
+        paramGroups: optional dict(key -> list of parameters), e.g. the
+        parameters of each part, for reporting the remaining DOF of each group
+
+        tol: relative tolerance for rank determination
+
+        Return AnalyzeResult(Dof,Redundant,GroupDof,Singular), where 'Dof' is
+        the total remaining degree of freedom, 'Redundant' is a list of
+        redundant constraint handles, 'GroupDof' is a dict(key -> dof), and
+        'Singular' is a list of constraint handles whose gradient vanishes
+        at the current parameter values, e.g. PointsDistance of two
+        coincident points. These can not be judged by the Jacobian rank. Only
+        the equations of vanishing gradient are excluded from the redundancy
+        check, so a constraint is reported as singular only if all of its
+        equations are.
+        '''
+        if not group:
+            group = self.GroupHandle
+
+        params = {} # symbol -> value
+        param_table = {} # symbol -> _Param object
+        for e in self.Params:
+            e.reset(group)
+            if e.group == group:
+                params[e._sym] = e.val
+                param_table[e._sym] = e
+        for e in self.Constraints:
+            e.reset(group)
+        for e in self.Entities:
+            e.reset(group)
+
+        # union-find of parameters linked by equations
+        parents = dict((x,x) for x in params)
+        def find(x):
+            while parents[x] != x:
+                parents[x] = parents[parents[x]]
+                x = parents[x]
+            return x
+
+        eqs = []
+        for objs in (self.Entities,self.Constraints):
+            for o in objs:
+                if o.group != group:
+                    continue
+                eq = o.getEqWithParams(params)
+                if not eq:
+                    continue
+                for e in eq if isinstance(eq,(list,tuple)) else [eq]:
+                    symbols = [x for x in e.free_symbols if x in params]
+                    if not symbols:
+                        continue
+                    root = find(symbols[0])
+                    for x in symbols[1:]:
+                        parents[find(x)] = root
+                    eqs.append((o,e,symbols[0]))
+
+        components = {}
+        for x in params:
+            components.setdefault(find(x),([],[]))[0].append(x)
+        for o,e,x in eqs:
+            components[find(x)][1].append((o,e))
+
+        dof = 0
+        redundant = []
+        # constraint -> [number of equations, number of vanishing ones]
+        rowCounts = {}
+        spaces = {} # component root -> null space basis
+        columns = {} # symbol -> (component root, column index)
+        for root,(symbols,ceqs) in components.items():
+            x0 = np.array([params[x] for x in symbols],dtype=float)
+            if not ceqs:
+                spaces[root] = np.eye(len(symbols))
+                for i,x in enumerate(symbols):
+                    columns[x] = (root,i)
+                dof += len(symbols)
+                continue
+
+            f = sp.lambdify(symbols,[e for _,e in ceqs],modules='numpy')
+            jac = np.empty((len(ceqs),len(symbols)))
+            for i in range(len(symbols)):
+                h = 1e-6*max(1.0,abs(x0[i]))
+                x = x0.copy()
+                x[i] += h
+                f1 = np.array(f(*x),dtype=float)
+                x[i] = x0[i]-h
+                f2 = np.array(f(*x),dtype=float)
+                jac[:,i] = (f1-f2)/(2*h)
+
+            # Greedy search of the redundant equations, in the order of
+            # constraint creation, by orthogonalizing each row against the
+            # rows accepted so far.
+            basis = []
+            scale = max(1.0,np.abs(jac).max())
+            for row,(o,_) in zip(jac,ceqs):
+                norm = np.linalg.norm(row)
+                counts = rowCounts.setdefault(o,[0,0])
+                counts[0] += 1
+                if norm <= tol*scale:
+                    counts[1] += 1
+                    continue
+                r = row
+                for b in basis:
+                    r = r - b.dot(r)*b
+                rnorm = np.linalg.norm(r)
+                if rnorm <= tol*max(1.0,norm):
+                    if isinstance(o,_Constraint) and o not in redundant:
+                        redundant.append(o)
+                    continue
+                basis.append(r/rnorm)
+
+            sv = np.linalg.svd(jac)
+            rank = int(np.sum(sv[1] > tol*max(1.0,sv[1][0])))
+            spaces[root] = sv[2][rank:].T
+            for i,x in enumerate(symbols):
+                columns[x] = (root,i)
+            dof += len(symbols) - rank
+
+        groupDof = {}
+        for key,group_params in (paramGroups or {}).items():
+            rows = {}
+            for p in group_params:
+                info = columns.get(getattr(p,'_sym',None),None)
+                if info:
+                    rows.setdefault(info[0],[]).append(info[1])
+            n = 0
+            for root,idx in rows.items():
+                space = spaces[root][idx,:]
+                if space.size:
+                    n += np.linalg.matrix_rank(space,tol)
+            groupDof[key] = n
+
+        self.Dof = dof
+        singular = [o for o in self.Constraints if o in rowCounts and
+                        rowCounts[o][0]==rowCounts[o][1]]
+        self.log('analyzed {} equations, {} parameters, {} components, '
+                'dof {}, redundant {}, singular {}',len(eqs),len(params),
+                    len(components),dof,len(redundant),len(singular))
+        return self.AnalyzeResult(Dof=dof,Redundant=redundant,
+                GroupDof=groupDof,Singular=singular)
+
+    @staticmethod
+    def _getHandle(objs,h,name):
+        if isinstance(h,int):
+            if 0 <= h < len(objs):
+                return objs[h]
+        else:
+            idx = getattr(h,'handle',-1)
+            if 0 <= idx < len(objs) and objs[idx] is h:
+                return h
+        raise KeyError('{} not found'.format(name))
+
+    @staticmethod
+    def _addHandle(objs,v):
+        v.handle = len(objs)
+        objs.append(v)
+        return v
+
+    @classmethod
+    def _removeHandle(cls,objs,h,name):
+        idx = cls._getHandle(objs,h,name).handle
+        del objs[idx]
+        for i in range(idx,len(objs)):
+            objs[i].handle = i
+
+    def getParam(self, h):
+        return self._getHandle(self.Params,h,'parameter')
+
+    def removeParam(self, h):
+        self._version = next(_versions)
+        self._removeHandle(self.Params,h,'parameter')
+
+    def addParam(self, v, overwrite=False):
+        _ = overwrite
+        self._version = next(_versions)
+        return self._addHandle(self.Params,v)
+
+    def getConstraint(self, h):
+        return self._getHandle(self.Constraints,h,'constraint')
+
+    def removeConstraint(self, h):
+        self._version = next(_versions)
+        self._removeHandle(self.Constraints,h,'constraint')
+
+    def addConstraint(self, v, overwrite=False):
+        _ = overwrite
+        self._version = next(_versions)
+        return self._addHandle(self.Constraints,v)
+
+    def getEntity(self, h):
+        return self._getHandle(self.Entities,h,'entity')
+
+    def removeEntity(self, h):
+        self._version = next(_versions)
+        self._removeHandle(self.Entities,h,'entity')
+
+    def addEntity(self, v, overwrite=False):
+        _ = overwrite
+        self._version = next(_versions)
+        return self._addHandle(self.Entities,v)
+
+    def getMark(self):
+        'Return a mark of the current system size for truncate()'
+        return (len(self.Params),len(self.Entities),len(self.Constraints),
+                len(self.Quaternions),self.Store.count,self._version)
+
+    def truncate(self, mark):
+        '''
+        Remove all parameters, entities and constraints added after the mark
+        returned by getMark()
+        '''
+        params,entities,cstrs,quaternions,count,version = mark
+        del self.Params[params:]
+        del self.Entities[entities:]
+        del self.Constraints[cstrs:]
+        del self.Quaternions[quaternions:]
+        # parameter values are stored in the order of creation
+        self.Store.count = count
+        self._version = version
+        args = dict([(k,p) for k,p in self.DrivingArgs.items()
+                        if self._isAlive(self.Constraints,k[0])])
+        argParams = set(args.values())
+        driving = [p for p in self.Driving
+                if p in argParams or self._isAlive(self.Params,p)]
+        if len(driving) != len(self.Driving):
+            self.Driving = driving
+            self.DrivingArgs = args
+            self._drivingVersion = next(_versions)
+
+    @staticmethod
+    def _isAlive(objs,o):
+        return 0 <= o.handle < len(objs) and objs[o.handle] is o
+
+    @staticmethod
+    def _getArgNames(o):
+        for k in o._args:
+            yield k
+        for k in o._opts:
+            yield k[0] if isinstance(k,tuple) else k
+
+    def updateValues(self,mark0,mark1,group):
+        '''
+        Copy the values of the items added after 'mark1' to the
+        corresponding items added between 'mark0' and 'mark1', and then
+        remove the former. Parameters of the solving 'group' are not copied.
+        Any changed constant becomes a driving parameter, so that the
+        equations generated by the last solve can be reused. Return False
+        without any change if the two sets of items are not of the same
+        structure.
+        '''
+        mark2 = self.getMark()
+        count = [b-a for a,b in zip(mark0[:3],mark1[:3])]
+        if count != [b-a for a,b in zip(mark1[:3],mark2[:3])]:
+            return False
+
+        # maps the new items to the old ones
+        itemMap = {}
+        pairs = []
+        for objs,start,n in zip((self.Params,self.Entities,self.Constraints),
+                                 mark0[:3],count):
+            for o0,o1 in zip(objs[start:start+n],objs[start+n:start+2*n]):
+                if type(o0) is not type(o1) or o0.group != o1.group:
+                    return False
+                itemMap[id(o1)] = o0
+                pairs.append((o0,o1))
+
+        params = []
+        args = []
+        for o0,o1 in pairs:
+            if isinstance(o0,_Param):
+                if o0.group!=group and (o0.driving or o0.val!=o1.val):
+                    params.append((o0,o1.val))
+                continue
+            for k in self._getArgNames(o0):
+                v0 = getattr(o0,k)
+                v1 = getattr(o1,k)
+                p = self.DrivingArgs.get((o0,k),None)
+                if p is not None:
+                    if not _isValue(v1):
+                        return False
+                    args.append((o0,k,v1))
+                elif _isValue(v0) and _isValue(v1):
+                    if v0 != v1:
+                        args.append((o0,k,v1))
+                elif isinstance(v1,_Base):
+                    if itemMap.get(id(v1),v1) is not v0:
+                        return False
+                elif v0 != v1:
+                    return False
+
+        self.truncate(mark1)
+
+        changed = False
+        for p,v in params:
+            p.val = v
+            p._val = None
+            if not p.driving:
+                p.driving = True
+                self.Driving.append(p)
+                changed = True
+        for o,k,v in args:
+            p = self.DrivingArgs.get((o,k),None)
+            if p is not None:
+                p.val = v
+                continue
+            p = _Param(o._name,v,o.group)
+            p.driving = True
+            self.Driving.append(p)
+            self.DrivingArgs[(o,k)] = p
+            setattr(o,k,p._sym)
+            changed = True
+        if changed:
+            # new driving parameters, the equations must be generated again
+            self._drivingVersion = next(_versions)
+        return True
+
+    def addParamV(self, val, group=0):
+        if not group:
+            group = self.GroupHandle
+        return self.addParam(_Param(self.Tag,val,group,self.Store))
+
+    @property
+    def Tag(self):
+        if self.verbose:
+            return self.NameTag.replace('.','_')
+        return self.NameTag
+
+
@@ -54,14 +54,32 @@ class System(ProxyType):
             obj.Proxy.onSolverChanged()
 
     @classmethod
-    def getSystem(mcs,obj):
+    def getSystem(mcs,obj,fallback=False):
+        '''
+        Return a solving system. If 'fallback' is True, return the system of
+        the next backend to try after a failed solving, or None if the solver
+        type does not support fallback.
+        '''
         proxy = mcs.getProxy(obj)
         if proxy:
-            system = proxy.getSystem(obj)
+            if not fallback:
+                system = proxy.getSystem(obj)
+            else:
+                getFallback = getattr(proxy,'getFallbackSystem',None)
+                if not getFallback:
+                    return
+                system = getFallback(obj)
             if isinstance(system,SystemExtension):
                 system.relax = obj.AutoRelax
             return system
 
+    @classmethod
+    def recordSolveCost(mcs,obj,cost):
+        proxy = mcs.getProxy(obj)
+        callback = getattr(proxy,'recordSolveCost',None)
+        if callback:
+            callback(obj,cost)
+
     @classmethod
     def isConstraintSupported(mcs,obj,name):
         if name == 'Locked':
@@ -75,13 +93,21 @@ def _makePropInfo(name,tp,doc='',default=None):
 
 _makePropInfo('Verbose','App::PropertyBool')
 _makePropInfo('AutoRelax','App::PropertyBool')
+_makePropInfo('CheckRedundancy','App::PropertyBool',
+        'Analyze the constraints before solving, and reject them if any\n'
+        'redundancy is found. Only supported by some solver backends')
 
 class SystemBase(object):
     __metaclass__ = System
     _id = 0
     _props = ['Verbose','AutoRelax']
 
-    def __init__(self,obj):
+    def __init__(self,obj,attach=True):
+        '''
+        attach: whether the backend may add its own dynamic properties to
+        'obj'. It is False when the backend is created by another system,
+        e.g. as a candidate of the Auto solver type.
+        '''
         self._touched = True
         self.verbose = obj.Verbose
         self.log = logger.info if self.verbose else logger.debug
@@ -126,6 +152,28 @@ class SystemExtension(object):
     def checkRedundancy(self,obj,firstInfo,secondInfo):
         self.cstrObj,self.firstInfo,self.secondInfo=obj,firstInfo,secondInfo
 
+    def addConstraints(self,obj,func,batch,group=0):
+        '''
+        Add a batch of constraints of the same type, e.g. expanded from a
+        pattern constraint
+
+        batch: a list of tuple(firstInfo,secondInfo,params), where 'params'
+        is passed to 'func' to add each constraint
+
+        Return a list of the added constraint handles
+        '''
+        if not group:
+            group = self.GroupHandle
+        ret = []
+        for firstInfo,secondInfo,params in batch:
+            self.checkRedundancy(obj,firstInfo,secondInfo)
+            h = func(*params,group=group)
+            if isinstance(h,(list,tuple)):
+                ret += list(h)
+            else:
+                ret.append(h)
+        return ret
+
     def addSketchPlane(self,*args,**kargs):
         _ = kargs
         self.sketchPlane = args[0] if args else None